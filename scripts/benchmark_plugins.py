@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the rendering pipeline of every plugin across panel resolutions and orientations.
+
+Network and Open AI calls are replayed from the recorded responses in
+scripts/benchmark/fixtures (see utils/network_replay.py), so runs are repeatable offline. Each stage (generate_image,
+change_orientation, resize_image, getbuffer with its quantize and pack steps) is timed
+over a number of repeats after warmup runs, and its peak traced memory is measured in
+one extra run. Traced memory covers Python and numpy allocations, Pillow's image
+buffers are allocated outside of tracemalloc and only show in the process peak RSS.
+Baselines are stored per machine architecture (platform.machine()), stages slower than
+the baseline of the current architecture by more than the tolerance fail the run. Without
+a baseline for the architecture nothing is compared, store one with --update-baseline.
+
+Usage, from the repository root:
+    python scripts/benchmark_plugins.py                      # all plugins, compare to the baseline
+    python scripts/benchmark_plugins.py --plugin clock -r 10
+    python scripts/benchmark_plugins.py --update-baseline    # store the results as the new baseline
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import resource
+import platform
+import statistics
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_DIR, "src")
+BENCHMARK_DIR = os.path.join(REPO_DIR, "scripts", "benchmark")
+FIXTURES_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+DEFAULT_BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+PLUGIN_CONFIG_FILE = os.path.join(SRC_DIR, "plugins", "plugins.json")
+
+sys.path.insert(0, SRC_DIR)
+os.environ.setdefault("SRC_DIR", SRC_DIR)
+
+from config import Config
+from plugins.plugin_registry import load_plugins, get_plugin_instance
+from utils.image_utils import resize_image, change_orientation
+from utils.network_replay import NetworkReplay
+
+RESOLUTIONS = [
+    [400, 300],	# Inky wHAT
+    [640, 400], # Inky Impression 4"
+    [600, 448], # Inky Impression 5.7"
+    [800, 480], # Inky Impression 7.3"
+]
+ORIENTATIONS = ["horizontal", "vertical"]
+
+FIXTURE_CALENDAR_URL = "https://fixtures.inkypi.invalid/calendar.ics"
+# one case per plugin, and per face for the clock since the faces render very differently
+CASES = [
+    ("ai_image", "ai_image", {"inputText": "A lighthouse at dusk", "imageModel": "dall-e-3", "quality": "standard"}),
+    ("ai_text", "ai_text", {"title": "Today In History", "textModel": "gpt-4o", "inputText": "Events on this day in history", "selectedFrame": "Rectangle"}),
+    ("image_upload", "image_upload", {"imageFile": os.path.join(FIXTURES_DIR, "photo.jpg")}),
+    ("newspaper", "newspaper", {"newspaperSlug": "NY_NYT"}),
+    ("clock-gradient", "clock", {"selectedClockFace": "Gradient Clock"}),
+    ("clock-digital", "clock", {"selectedClockFace": "Digital Clock"}),
+    ("clock-divided", "clock", {"selectedClockFace": "Divided Clock"}),
+    ("clock-word", "clock", {"selectedClockFace": "Word Clock"}),
+    ("calendar", "calendar", {"inputText": FIXTURE_CALENDAR_URL, "daysToShow": "5"}),
+]
+STAGES = ["generate_image", "change_orientation", "resize_image", "getbuffer", "quantize", "pack"]
+DEFAULT_TOLERANCE = 0.25
+# regressions smaller than this are timer noise, e.g. for sub-millisecond stages
+MIN_REGRESSION_SECONDS = 0.002
+
+class BenchmarkConfig(Config):
+    """
+    Device config of a benchmark run, read from a device.json in a temporary directory.
+
+    Settings are read by the real Config, so plugins see unset settings as on a device.
+    """
+
+    def __init__(self, resolution, orientation, cache_dir):
+        self.config_file = os.path.join(cache_dir, "device.json")
+        self.plugins_file = PLUGIN_CONFIG_FILE
+        self.cache_dir = cache_dir
+        self.current_image_file = os.path.join(cache_dir, "current_image.png")
+        with open(self.config_file, "w") as f:
+            json.dump({"name": "InkyPi Benchmark", "resolution": resolution, "orientation": orientation, "timezone": "America/Vancouver"}, f)
+        super().__init__()
+
+def load_driver():
+    """
+    Returns the panel driver, its GPIO and SPI layer is replaced off the Raspberry Pi.
+
+    getbuffer only quantizes and packs the image, so it runs the same without the panel.
+    """
+    try:
+        from waveshare_epd import epd7in3f
+    except (ImportError, RuntimeError, OSError):
+        epdconfig = types.ModuleType("waveshare_epd.epdconfig")
+        epdconfig.RST_PIN, epdconfig.DC_PIN, epdconfig.CS_PIN, epdconfig.BUSY_PIN = 17, 25, 8, 24
+        sys.modules["waveshare_epd.epdconfig"] = epdconfig
+        sys.modules.pop("waveshare_epd.epd7in3f", None)
+        from waveshare_epd import epd7in3f
+    return epd7in3f.EPD()
+
+def run_pipeline(plugin, plugin_config, settings, device_config, epd, timings):
+    """Renders the plugin once like DisplayManager does, adding the duration of each stage to timings."""
+    resolution = device_config.get_resolution()
+    orientation = device_config.get_config("orientation")
+
+    start = time.perf_counter()
+    image = plugin.generate_image(settings, device_config)
+    # opened images are decoded lazily, the decode belongs to the plugin's stage
+    image.load()
+    timings["generate_image"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = change_orientation(image, orientation)
+    timings["change_orientation"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = resize_image(image, resolution, plugin_config.get("image_settings", []))
+    timings["resize_image"] = time.perf_counter() - start
+
+    # the driver packs any even sized frame, its size is set to the resolution benchmarked
+    epd.width, epd.height = resolution
+    start = time.perf_counter()
+    frame = epd.getbuffer(image, timings)
+    timings["getbuffer"] = time.perf_counter() - start
+    return frame
+
+def measure_peak_memory(function, stages):
+    """Runs the function once under tracemalloc and returns the peak traced memory of each stage."""
+    peaks = {}
+
+    class StageTimings(dict):
+        # a stage is complete when its timing is stored, the peak is read and reset then
+        def __setitem__(self, stage, seconds):
+            super().__setitem__(stage, seconds)
+            if stage in stages:
+                peaks[stage] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    try:
+        function(StageTimings())
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def benchmark_case(case_name, plugin_id, settings, plugin_configs, epd, resolutions, orientations, warmup, repeats):
+    plugin_config = plugin_configs[plugin_id]
+    plugin = get_plugin_instance(plugin_config)
+    results = {}
+    for resolution in resolutions:
+        for orientation in orientations:
+            key = f"{case_name}/{resolution[0]}x{resolution[1]}/{orientation}"
+            with tempfile.TemporaryDirectory(prefix="inkypi-benchmark-") as cache_dir:
+                device_config = BenchmarkConfig(resolution, orientation, cache_dir)
+                render = lambda timings: run_pipeline(plugin, plugin_config, settings, device_config, epd, timings)
+
+                # warmup runs fill the plugins' caches, later runs measure the steady state
+                for _ in range(warmup):
+                    render({})
+                samples = {stage: [] for stage in STAGES}
+                for _ in range(repeats):
+                    timings = {}
+                    render(timings)
+                    for stage in STAGES:
+                        samples[stage].append(timings[stage])
+                # "quantize" and "pack" are reported inside getbuffer, the peak of getbuffer covers both
+                peaks = measure_peak_memory(render, {"generate_image", "change_orientation", "resize_image", "getbuffer"})
+
+            results[key] = {
+                stage: {
+                    "median": statistics.median(values),
+                    "min": min(values),
+                    "max": max(values),
+                    "peak_memory": peaks.get(stage)
+                }
+                for stage, values in samples.items()
+            }
+            print_result(key, results[key])
+    return results
+
+def print_result(key, result):
+    parts = []
+    for stage in STAGES:
+        stats = result[stage]
+        memory = f" {stats['peak_memory'] / 1024 / 1024:.1f}MiB" if stats["peak_memory"] is not None else ""
+        parts.append(f"{stage} {stats['median'] * 1000:.1f}ms{memory}")
+    print(f"{key:<40} " + ", ".join(parts))
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compares the results with the baseline.
+
+    :return: Tuple of the stages that regressed past the baseline, as printable lines,
+        and the runs without a baseline.
+    """
+    regressions = []
+    missing = [key for key in results if key not in baseline]
+    for key, result in results.items():
+        for stage, stats in result.items():
+            expected = baseline.get(key, {}).get(stage, {}).get("median")
+            if expected is None:
+                continue
+            if stats["median"] > expected * (1 + tolerance) and stats["median"] - expected > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{key} {stage}: {stats['median'] * 1000:.1f}ms, baseline {expected * 1000:.1f}ms "
+                                   f"(+{(stats['median'] / expected - 1) * 100:.0f}%)")
+    return regressions, missing
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark plugin rendering against recorded network fixtures")
+    parser.add_argument("--plugin", action="append", help="plugin id or case name to benchmark, can be repeated (default: all)")
+    parser.add_argument("--resolution", action="append", help="resolution as WIDTHxHEIGHT, can be repeated (default: all)")
+    parser.add_argument("--orientation", action="append", choices=ORIENTATIONS, help="orientation, can be repeated (default: both)")
+    parser.add_argument("-w", "--warmup", type=int, default=1, help="untimed runs before measuring (default: 1)")
+    parser.add_argument("-r", "--repeats", type=int, default=5, help="timed runs per stage (default: 5)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="baseline file to compare with or update")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown of a stage's median, 0.25 is 25%% (default)")
+    parser.add_argument("--output", help="also write the results to this json file")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="directory of the recorded network responses to replay")
+    parser.add_argument("--latency", type=float, default=0, help="wait this factor of the recorded response times, 1 is as recorded (default: 0)")
+    args = parser.parse_args()
+
+    cases = [case for case in CASES if not args.plugin or case[0] in args.plugin or case[1] in args.plugin]
+    if not cases:
+        sys.exit(f"No benchmark case for {', '.join(args.plugin)}, cases: {', '.join(case[0] for case in CASES)}")
+    resolutions = [list(map(int, resolution.lower().split("x"))) for resolution in args.resolution] if args.resolution else RESOLUTIONS
+    orientations = args.orientation or ORIENTATIONS
+
+    with open(PLUGIN_CONFIG_FILE) as f:
+        plugin_configs = {config["id"]: config for config in json.load(f)}
+    # the Open AI plugins only need a key to build their client, the calls are served from fixtures
+    load_plugins(plugin_configs.values(), secrets={"OPEN_AI_SECRET": "benchmark-fixture-key"})
+    epd = load_driver()
+
+    print(f"Python {platform.python_version()} on {platform.machine()}, {args.warmup} warmup and {args.repeats} timed runs, median time and peak memory per stage")
+    results = {}
+    with NetworkReplay(args.fixtures, "replay", latency=args.latency):
+        for case_name, plugin_id, settings in cases:
+            results.update(benchmark_case(case_name, plugin_id, settings, plugin_configs, epd,
+                                          resolutions, orientations, args.warmup, args.repeats))
+
+    print(f"Peak RSS of the process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    # timings only compare on the same hardware, baselines are keyed by architecture
+    machine = platform.machine()
+    baselines = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.update_baseline:
+        baselines.setdefault(machine, {}).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Stored {machine} baseline of {len(results)} runs in {args.baseline}")
+        return
+
+    baseline = baselines.get(machine)
+    if not baseline:
+        print(f"\nWARNING: no {machine} baseline in {args.baseline}, nothing was compared. Run with --update-baseline to store one.")
+        return
+    regressions, missing = compare_to_baseline(results, baseline, args.tolerance)
+    if missing:
+        print(f"\nWARNING: {len(missing)} runs have no baseline and were not compared, store them with --update-baseline:")
+        for key in missing:
+            print(f"  {key}")
+    if regressions:
+        print(f"\n{len(regressions)} stages regressed by more than {args.tolerance * 100:.0f}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\nNo stage regressed by more than {args.tolerance * 100:.0f}% against the {machine} baseline in {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -4,23 +4,48 @@ import json
 import os
 import logging
 from utils.app_utils import resolve_path
+from utils.upload_utils import ingest_image
+from plugins.plugin_registry import get_plugin_instance
+from PIL import Image
 
 logger = logging.getLogger(__name__)
 display_bp = Blueprint("display", __name__)
 
 ALLOWED_FILE_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif'}
+IMAGE_FILE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 FILE_SAVE_DIR = resolve_path(os.path.join("static", "images", "saved"))
 
-def handle_request_files(request_files):
+def handle_request_files(request_files, plugin_id=None):
+    """
+    Saves uploaded files and returns their paths by form field.
+
+    Images are stored once per content as panel sized masters and passed to the
+    on_upload hook of the plugin they are uploaded for.
+    """
+    device_config = current_app.config['DEVICE_CONFIG']
+
     file_location_map = {}
-    for key, file in request.files.items():
+    for key, file in request_files.items():
         file_name = file.filename
         if '.' not in file_name or file_name.rsplit('.', 1)[1].lower() not in ALLOWED_FILE_EXTENSIONS:
             continue
         file_name = os.path.basename(file_name)
-        file_path = os.path.join(FILE_SAVE_DIR, file_name)
-        file.save(file_path)
+
+        if file_name.rsplit('.', 1)[1].lower() not in IMAGE_FILE_EXTENSIONS:
+            file_path = os.path.join(FILE_SAVE_DIR, file_name)
+            file.save(file_path)
+            file_location_map[key] = file_path
+            continue
+
+        try:
+            _, file_path = ingest_image(file.stream, FILE_SAVE_DIR, device_config.get_resolution())
+        except (OSError, Image.DecompressionBombError) as e:
+            raise RuntimeError(f"Failed to read uploaded image {file_name}: {e}")
         file_location_map[key] = file_path
+
+        plugin_config = device_config.get_plugin(plugin_id) if plugin_id else None
+        if plugin_config:
+            get_plugin_instance(plugin_config).on_upload(file_path, device_config)
     return file_location_map
 
 @display_bp.route('/update_now', methods=['POST'])
@@ -30,7 +55,7 @@ def update_now():
 
     try:
         plugin_settings = request.form.to_dict()  # Get all form data
-        plugin_settings.update(handle_request_files(request.files))
+        plugin_settings.update(handle_request_files(request.files, plugin_settings.get("plugin_id")))
 
         refresh_task.manual_update(plugin_settings)
     except RuntimeError as e:
@@ -55,7 +80,7 @@ def schedule_plugin():
             raise RuntimeError("Invalid refresh unit.")
 
         plugin_settings = form_data
-        plugin_settings.update(handle_request_files(request.files))
+        plugin_settings.update(handle_request_files(request.files, plugin_settings.get("plugin_id")))
 
         refresh_interval_seconds = calculate_seconds(int(refresh_settings.get("interval")), refresh_settings.get("unit"))
         device_config.update_value("refresh_settings", {
@@ -63,6 +88,9 @@ def schedule_plugin():
             "plugin_settings": plugin_settings
         })
         refresh_task.update_refresh_settings()
+
+        # start pre-generating for the new schedule right away
+        current_app.config['GENERATION_QUEUE'].notify()
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
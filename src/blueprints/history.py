@@ -0,0 +1,34 @@
+from flask import Blueprint, jsonify, current_app, send_file, abort
+import logging
+
+logger = logging.getLogger(__name__)
+history_bp = Blueprint("history", __name__)
+
+@history_bp.route('/history')
+def history():
+    display_manager = current_app.config['DISPLAY_MANAGER']
+    return jsonify(display_manager.history.get_entries())
+
+@history_bp.route('/history/<int:entry_id>/preview')
+def history_preview(entry_id):
+    display_manager = current_app.config['DISPLAY_MANAGER']
+    try:
+        preview_path = display_manager.history.get_preview_path(entry_id)
+    except OSError as e:
+        logger.error(f"Failed to read history entry {entry_id}: {e}")
+        abort(404)
+    if not preview_path:
+        abort(404)
+    # entry ids start over when the history is lost, the long asset lifetime doesn't apply
+    return send_file(preview_path, mimetype="image/png", max_age=0)
+
+@history_bp.route('/history/<int:entry_id>/display', methods=['POST'])
+def history_display(entry_id):
+    display_manager = current_app.config['DISPLAY_MANAGER']
+    try:
+        display_manager.display_history_frame(entry_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+    return jsonify({"success": True, "message": "Display updated"}), 200
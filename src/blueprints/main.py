@@ -1,8 +1,54 @@
-from flask import Blueprint, request, jsonify, current_app, render_template
+from flask import Blueprint, request, jsonify, current_app, render_template, make_response, send_file, abort
+from display_history import PREVIEW_SIZES, PREVIEW_FORMATS
+from utils.metrics import render_metrics
 
 main_bp = Blueprint("main", __name__)
 
 @main_bp.route('/')
 def main_page():
     device_config = current_app.config['DEVICE_CONFIG']
-    return render_template('inky.html', config=device_config.get_config(), plugins=device_config.get_plugins())
\ No newline at end of file
+    return render_template('inky.html', config=device_config.get_config(), plugins=device_config.get_plugins())
+
+@main_bp.route('/startup_stats')
+def startup_stats():
+    startup_orchestrator = current_app.config['STARTUP_ORCHESTRATOR']
+    return jsonify(startup_orchestrator.get_timings())
+
+@main_bp.route('/preview')
+def preview():
+    """
+    Serves what is on the panel, decoded from the displayed frame, in several sizes and formats.
+
+    Responses carry an ETag of the frame and variant and are revalidated on every
+    page view, an unchanged frame is answered with 304 Not Modified.
+    """
+    device_config = current_app.config['DEVICE_CONFIG']
+    display_manager = current_app.config['DISPLAY_MANAGER']
+
+    size = request.args.get("size", "large")
+    image_format = request.args.get("format", "png")
+    if size not in PREVIEW_SIZES or image_format not in PREVIEW_FORMATS:
+        abort(400)
+
+    # the entry on the panel, which is an older one after a frame was replayed from the history
+    entry = display_manager.history.get_current_entry()
+    if entry is None:
+        # the frame isn't in the history, e.g. it is disabled
+        return send_file(device_config.current_image_file, conditional=True, max_age=0)
+
+    etag = f"{entry['id']}-{int(entry['displayed_at'])}-{size}-{image_format}"
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(display_manager.history.get_preview_variant(entry['id'], size, image_format))
+        response.mimetype = PREVIEW_FORMATS[image_format]
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@main_bp.route('/metrics')
+def metrics():
+    """Refresh stage timings, cache hit counts and panel counters in the Prometheus text format."""
+    response = make_response(render_metrics())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
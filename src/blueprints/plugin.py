@@ -1,5 +1,5 @@
 from flask import Blueprint, jsonify, current_app, render_template, send_from_directory
-from plugins.plugin_registry import get_plugin_instance
+from plugins.plugin_registry import get_plugin_instance, get_plugin_load_stats
 from utils.app_utils import resolve_path
 import os
 import logging
@@ -16,7 +16,7 @@ SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 def plugin_page(plugin_id):
     device_config = current_app.config['DEVICE_CONFIG']
     # Find the plugin by id
-    plugin_config = next((plugin for plugin in device_config.get_plugins() if plugin['id'] == plugin_id), None)
+    plugin_config = device_config.get_plugin(plugin_id)
     if plugin_config:
         try:
             plugin_instance = get_plugin_instance(plugin_config)
@@ -31,3 +31,7 @@ def plugin_page(plugin_id):
 @plugin_bp.route('/images/<plugin_id>/<path:filename>')
 def image(plugin_id, filename):
     return send_from_directory(PLUGINS_DIR, os.path.join(plugin_id, filename))
+
+@plugin_bp.route('/load_stats')
+def load_stats():
+    return jsonify(get_plugin_load_stats())
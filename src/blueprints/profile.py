@@ -0,0 +1,50 @@
+from flask import Blueprint, request, jsonify, current_app, send_file, abort
+from refresh_profiler import ARTIFACTS
+import logging
+
+logger = logging.getLogger(__name__)
+profile_bp = Blueprint("profile", __name__)
+
+@profile_bp.route('/profiles')
+def profiles():
+    display_manager = current_app.config['DISPLAY_MANAGER']
+    return jsonify({**display_manager.profiler.get_state(), "profiles": display_manager.profiler.get_entries()})
+
+@profile_bp.route('/profiles/arm', methods=['POST'])
+def arm_profiler():
+    """
+    Profiles the next refresh, optionally only of a plugin. With refresh_now the
+    scheduled plugin is refreshed right away instead of at its next interval.
+    """
+    display_manager = current_app.config['DISPLAY_MANAGER']
+    refresh_task = current_app.config['REFRESH_TASK']
+    device_config = current_app.config['DEVICE_CONFIG']
+
+    data = request.get_json(silent=True) or request.form.to_dict()
+    plugin_id = data.get("plugin_id") or None
+    if plugin_id and not device_config.get_plugin(plugin_id):
+        return jsonify({"error": f"Plugin '{plugin_id}' not found."}), 404
+
+    display_manager.profiler.arm(plugin_id)
+    if str(data.get("refresh_now", "")).lower() in ("1", "true", "on"):
+        try:
+            refresh_task.update_refresh_settings()
+        except Exception as e:
+            return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+    return jsonify({"success": True, **display_manager.profiler.get_state()}), 200
+
+@profile_bp.route('/profiles/disarm', methods=['POST'])
+def disarm_profiler():
+    display_manager = current_app.config['DISPLAY_MANAGER']
+    display_manager.profiler.disarm()
+    return jsonify({"success": True, **display_manager.profiler.get_state()}), 200
+
+@profile_bp.route('/profiles/<int:entry_id>/<artifact>')
+def profile_artifact(entry_id, artifact):
+    display_manager = current_app.config['DISPLAY_MANAGER']
+    file_path = display_manager.profiler.get_artifact_path(entry_id, artifact)
+    if not file_path:
+        abort(404)
+    # capture ids start over when the index is lost, the long asset lifetime doesn't apply
+    return send_file(file_path, mimetype=ARTIFACTS[artifact][1], as_attachment=True, max_age=0,
+                     download_name=f"refresh-profile-{entry_id}.{ARTIFACTS[artifact][0]}")
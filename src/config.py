@@ -1,10 +1,83 @@
 import os
 import json
+import time
 import logging
-from dotenv import load_dotenv
+import threading
+from types import MappingProxyType
+from dotenv import dotenv_values, find_dotenv
 
 logger = logging.getLogger(__name__)
 
+def freeze(value):
+    """
+    Recursively convert dicts and lists into read-only mappings and tuples.
+
+    Frozen values are MappingProxyType and tuple objects, which json.dumps does not
+    accept as they are, convert them back with thaw() before serializing or changing them.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value):
+    """Recursively convert a frozen value back into plain dicts and lists."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+class ConfigSnapshot:
+    """Immutable view of the device config and plugins list at a point in time."""
+    __slots__ = ("config", "plugins", "plugins_by_id")
+
+    def __init__(self, config, plugins):
+        self.config = freeze(config)
+        self.plugins = freeze(plugins)
+        self.plugins_by_id = MappingProxyType({plugin["id"]: plugin for plugin in self.plugins})
+
+class SecretsProvider:
+    """Caches the values in the .env file, re-reading it only when its mtime changes."""
+
+    # Minimum number of seconds between checks of the .env file for changes
+    RELOAD_CHECK_INTERVAL = 30
+
+    def __init__(self, env_file=None):
+        self._env_file = env_file
+        self._lock = threading.Lock()
+        self._last_check = None
+        self._mtime = None
+        self._values = {}
+
+    def get(self, key, default=None):
+        self._reload_if_changed()
+        value = self._values.get(key)
+        if value is None:
+            value = os.getenv(key, default)
+        return value
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+            return
+
+        with self._lock:
+            if self._last_check is not None and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+                return
+            self._last_check = now
+
+            # search from this module's directory upwards, like load_dotenv does
+            env_file = self._env_file or find_dotenv()
+            mtime = Config._get_mtime(env_file) if env_file else None
+            if mtime == self._mtime:
+                return
+
+            logger.info(f"Loading secrets from {env_file}")
+            self._values = dotenv_values(env_file) if mtime is not None else {}
+            self._mtime = mtime
+
 class Config:
     # Base path for the project directory
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,35 +88,76 @@ class Config:
 
     current_image_file = os.path.join(BASE_DIR, "static", "images", "current_image.png")
 
+    # Directory for pre-rendered frames and other derived data that can be regenerated
+    cache_dir = os.path.join(BASE_DIR, "cache")
+
+    # Minimum number of seconds between checks of the config files for external edits
+    RELOAD_CHECK_INTERVAL = 2
+
     def __init__(self):
         logger.info(self.config_file)
-        self.config = self.read_config()
-        self.plugins_list = self.read_plugins_list()
-    
+        # Serializes writers, readers never take it and only see published snapshots
+        self._write_lock = threading.Lock()
+        self._last_reload_check = time.monotonic()
+        self._config_mtime = Config._get_mtime(self.config_file)
+        self._plugins_mtime = Config._get_mtime(self.plugins_file)
+        self._snapshot = ConfigSnapshot(self.read_config(), self.read_plugins_list())
+        self.secrets = SecretsProvider()
+
+    @property
+    def config(self):
+        return self.get_snapshot().config
+
+    @property
+    def plugins_list(self):
+        return self.get_snapshot().plugins
+
     def read_config(self):
         logger.info(f"Reading device config from {self.config_file}")
         with open(self.config_file) as f:
             config = json.load(f)
         return config
-    
+
     def read_plugins_list(self):
         logger.info(f"Reading plugins list from from {self.plugins_file}")
         with open(self.plugins_file) as f:
             plugins_list = json.load(f)
         return plugins_list
 
-    def write_config(self):
+    def write_config(self, config=None):
+        if config is None:
+            config = thaw(self.get_snapshot().config)
         logger.info(f"Writing device config to {self.config_file}")
-        with open(self.config_file, 'w') as outfile:
-            json.dump(self.config, outfile, indent=4)
+        # write to a temp file and swap it in so readers never see a partial file
+        tmp_file = self.config_file + ".tmp"
+        with open(tmp_file, 'w') as outfile:
+            json.dump(config, outfile, indent=4)
+        os.replace(tmp_file, self.config_file)
+        self._config_mtime = Config._get_mtime(self.config_file)
 
-    def get_config(self, key=None):
+    def get_snapshot(self):
+        self.reload_if_changed()
+        return self._snapshot
+
+    def get_config(self, key=None, default=None):
+        """
+        Returns a device config value, or the whole config if no key is given.
+
+        Values are read-only: dicts are returned as MappingProxyType and lists as
+        tuples, use thaw() to get plain, json serializable copies.
+
+        :param default: Returned when the key is not set.
+        """
+        config = self.get_snapshot().config
         if key is not None:
-            return self.config.get(key, {})
-        return self.config
+            return config.get(key, default)
+        return config
 
     def get_plugins(self):
-        return self.plugins_list
+        return self.get_snapshot().plugins
+
+    def get_plugin(self, plugin_id):
+        return self.get_snapshot().plugins_by_id.get(plugin_id)
 
     def get_resolution(self):
         resolution = self.get_config("resolution")
@@ -51,13 +165,53 @@ class Config:
         return (int(width), int(height))
 
     def update_config(self, config):
-        self.config.update(config)
-        self.write_config()
+        with self._write_lock:
+            new_config = thaw(self._snapshot.config)
+            new_config.update(config)
+            self._publish(new_config)
 
     def update_value(self, key, value):
-        self.config[key] = value
-        self.write_config()
-    
+        with self._write_lock:
+            new_config = thaw(self._snapshot.config)
+            new_config[key] = value
+            self._publish(new_config)
+
+    def reload_if_changed(self, force=False):
+        """Reload device.json and plugins.json if they were modified on disk."""
+        now = time.monotonic()
+        if not force and now - self._last_reload_check < self.RELOAD_CHECK_INTERVAL:
+            return False
+        self._last_reload_check = now
+
+        config_mtime = Config._get_mtime(self.config_file)
+        plugins_mtime = Config._get_mtime(self.plugins_file)
+        if config_mtime == self._config_mtime and plugins_mtime == self._plugins_mtime:
+            return False
+
+        with self._write_lock:
+            try:
+                config = self.read_config() if config_mtime != self._config_mtime else thaw(self._snapshot.config)
+                plugins = self.read_plugins_list() if plugins_mtime != self._plugins_mtime else thaw(self._snapshot.plugins)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to reload config files, keeping current config: {e}")
+                return False
+            self._config_mtime = config_mtime
+            self._plugins_mtime = plugins_mtime
+            self._snapshot = ConfigSnapshot(config, plugins)
+        logger.info("Reloaded config files after external change")
+        return True
+
     def load_env_key(self, key):
-        load_dotenv(override=True)
-        return os.getenv(key)
\ No newline at end of file
+        return self.secrets.get(key)
+
+    def _publish(self, config):
+        # persist first so the published snapshot always matches what is on disk
+        self.write_config(config)
+        self._snapshot = ConfigSnapshot(config, self._snapshot.plugins)
+
+    @staticmethod
+    def _get_mtime(file_path):
+        try:
+            return os.stat(file_path).st_mtime_ns
+        except OSError:
+            return None
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import zlib
+import queue
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from PIL import Image
+from utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = "history"
+INDEX_FILE = "index.json"
+DEFAULT_HISTORY_SIZE = 20
+# longest side of the preview variants in pixels, None keeps the panel size
+PREVIEW_SIZES = {"small": 240, "medium": 480, "large": 800, "full": None}
+PREVIEW_FORMATS = {"png": "image/png", "webp": "image/webp"}
+# encoded preview variants kept in memory
+PREVIEW_CACHE_SIZE = 16
+
+class DisplayHistory:
+    def __init__(self, device_config, decode_frame):
+        """
+        Ring of the last frames sent to the panel, stored as zlib compressed packed frames.
+
+        Frames are written on a background thread after the refresh, together with the
+        current image preview used by the web UI. Previews of older frames are decoded
+        when they are first requested.
+
+        :param device_config: The device configuration (Config class).
+        :param decode_frame: Function decoding a packed frame into an image in the panel's orientation.
+        """
+        self.device_config = device_config
+        self.decode_frame = decode_frame
+        self.history_dir = os.path.join(device_config.cache_dir, HISTORY_DIR)
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self.entries = self._load_index()
+        # id of the entry that is on the panel, replaying an older frame points it back
+        self.current_id = self.entries[-1]["id"] if self.entries else None
+        self.preview_variants = OrderedDict()
+        self.next_id = max((entry["id"] for entry in self.entries), default=0) + 1
+
+    def record(self, frame, metadata, image=None):
+        """
+        Queues a displayed frame to be added to the history.
+
+        :param metadata: Dictionary stored with the frame, e.g. the plugin id and orientation.
+        :param image: Image the frame was rendered from, saved as the current image preview.
+            The preview is decoded from the frame if not given.
+        """
+        self._queue(frame, dict(metadata, displayed_at=time.time()), image, None)
+
+    def record_replay(self, entry_id, frame):
+        """
+        Queues marking a stored frame that was displayed again as the current one.
+
+        The replay goes through the same queue as new frames, so it is applied in display order.
+        """
+        entry = self.get_entry(entry_id)
+        if entry is None:
+            raise ValueError(f"History entry {entry_id} not found.")
+        self._queue(frame, entry, None, entry_id)
+
+    def _queue(self, frame, metadata, image, replayed_id):
+        if not self.thread or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="display-history", daemon=True)
+            self.thread.start()
+        self.queue.put((frame, metadata, image, replayed_id))
+
+    def flush(self):
+        """Blocks until all queued frames are written."""
+        self.queue.join()
+
+    def get_entries(self):
+        """Returns the metadata of the stored frames, newest first."""
+        with self.lock:
+            return [dict(entry) for entry in reversed(self.entries)]
+
+    def get_entry(self, entry_id):
+        with self.lock:
+            return next((dict(entry) for entry in self.entries if entry["id"] == entry_id), None)
+
+    def get_current_entry(self):
+        """Returns the entry of the frame that is on the panel, or None if it isn't in the history."""
+        with self.lock:
+            return next((dict(entry) for entry in self.entries if entry["id"] == self.current_id), None)
+
+    def get_preview_variant(self, entry_id, size="large", image_format="png"):
+        """
+        Returns a stored frame decoded and encoded as a preview, each variant is encoded once.
+
+        :param size: One of PREVIEW_SIZES.
+        :param image_format: One of PREVIEW_FORMATS.
+        :return: The encoded image as bytes.
+        """
+        key = (entry_id, size, image_format)
+        with self.lock:
+            record_cache_lookup("preview", key in self.preview_variants)
+            if key in self.preview_variants:
+                self.preview_variants.move_to_end(key)
+                return self.preview_variants[key]
+
+        entry = self.get_entry(entry_id)
+        image = self.get_preview(self.get_frame(entry_id), entry)
+        if PREVIEW_SIZES[size]:
+            # panel colors are flat, so a plain downscale keeps them readable
+            image.thumbnail((PREVIEW_SIZES[size], PREVIEW_SIZES[size]), Image.BILINEAR)
+
+        output = BytesIO()
+        if image_format == "webp":
+            image.save(output, format="WEBP", lossless=True, method=4)
+        else:
+            image.save(output, format="PNG", optimize=True)
+        data = output.getvalue()
+
+        with self.lock:
+            self.preview_variants[key] = data
+            while len(self.preview_variants) > PREVIEW_CACHE_SIZE:
+                self.preview_variants.popitem(last=False)
+        return data
+
+    def get_frame(self, entry_id):
+        with open(self._get_path(entry_id, "bin"), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def get_preview_path(self, entry_id):
+        """
+        Returns the path of the preview image of a stored frame, decoding it on first use.
+        """
+        entry = self.get_entry(entry_id)
+        if entry is None:
+            return None
+
+        preview_path = self._get_path(entry_id, "png")
+        if not os.path.isfile(preview_path):
+            self._write_file(preview_path, lambda f: self.get_preview(self.get_frame(entry_id), entry).save(f, format="PNG"))
+        return preview_path
+
+    def get_preview(self, frame, metadata):
+        """Decodes a frame into an image as shown to a viewer of the panel."""
+        image = self.decode_frame(frame)
+        if metadata.get("orientation") == "vertical":
+            image = image.rotate(-90, expand=1)
+        return image
+
+    def save_current_image(self, frame, metadata, image=None):
+        """Saves the preview of the web UI for a frame that is on the panel."""
+        if image is None:
+            image = self.get_preview(frame, metadata)
+        self._write_file(self.device_config.current_image_file, lambda f: image.save(f, format="PNG"))
+
+    def _run(self):
+        while True:
+            frame, metadata, image, replayed_id = self.queue.get()
+            try:
+                start = time.perf_counter()
+                self.save_current_image(frame, metadata, image)
+                if replayed_id is None:
+                    self._add(frame, metadata)
+                else:
+                    with self.lock:
+                        self.current_id = replayed_id
+                logger.debug(f"Wrote display history in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                logger.exception(f"Failed to write display history: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _add(self, frame, metadata):
+        history_size = int(self.device_config.get_config("history_size", default=DEFAULT_HISTORY_SIZE))
+        if history_size <= 0:
+            with self.lock:
+                self.current_id = None
+            return
+
+        os.makedirs(self.history_dir, exist_ok=True)
+        entry_id = self.next_id
+        self.next_id += 1
+        compressed = zlib.compress(bytes(frame), 6)
+        self._write_file(self._get_path(entry_id, "bin"), lambda f: f.write(compressed))
+
+        with self.lock:
+            self.entries.append(dict(metadata, id=entry_id, size=len(compressed)))
+            # drop the oldest frames beyond the ring size
+            removed = self.entries[:-history_size]
+            self.entries = self.entries[-history_size:]
+            self.current_id = entry_id
+            self._write_file(os.path.join(self.history_dir, INDEX_FILE), lambda f: f.write(json.dumps(self.entries, indent=2).encode()))
+
+        for entry in removed:
+            for extension in ("bin", "png"):
+                try:
+                    os.remove(self._get_path(entry["id"], extension))
+                except FileNotFoundError:
+                    pass
+
+    def _get_path(self, entry_id, extension):
+        return os.path.join(self.history_dir, f"{int(entry_id)}.{extension}")
+
+    def _load_index(self):
+        index_file = os.path.join(self.history_dir, INDEX_FILE)
+        if not os.path.isfile(index_file):
+            return []
+        try:
+            with open(index_file) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read display history index {index_file}: {e}")
+            return []
+
+    @staticmethod
+    def _write_file(file_path, write):
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, file_path)
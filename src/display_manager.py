@@ -1,8 +1,18 @@
 import os
 import time
+import threading
+import numpy as np
+from PIL import Image
 from waveshare_epd import epd7in3f
 from utils.image_utils import resize_image, change_orientation
 from plugins.plugin_registry import get_plugin_instance
+from display_history import DisplayHistory
+from refresh_profiler import RefreshProfiler
+from utils.metrics import histogram, counter
+
+STAGE_SECONDS = histogram("inkypi_display_stage_seconds", "Duration of each stage of showing a frame on the panel.", labels=("stage",))
+PLUGIN_RENDER_SECONDS = histogram("inkypi_plugin_render_seconds", "Time from plugin settings to a packed frame, by plugin and whether it was pre-rendered.", labels=("plugin_id", "source"))
+SPI_BYTES = counter("inkypi_spi_bytes_total", "Frame bytes sent to the panel over SPI.")
 
 class DisplayManager:
     def __init__(self, device_config):
@@ -14,10 +24,33 @@ class DisplayManager:
         """
         self.device_config = device_config
         self.epd = epd7in3f.EPD()
-        self.epd.init()
+
+        # the panel is initialized on first use (or by the startup task) since
+        # the reset and busy waits would otherwise block startup
+        self.panel_ready = False
+        self.lock = threading.RLock()
+        self.first_frame_time = None
+
+        # frames shown on the panel, also writes the current image preview
+        self.history = DisplayHistory(device_config, self.frame_to_image)
+
+        # profiles a single refresh on request
+        self.profiler = RefreshProfiler(device_config)
 
         # store display resolution in device config
-        device_config.update_value("resolution", [800, 480])
+        resolution = [self.epd.width, self.epd.height]
+        if list(device_config.get_config("resolution") or []) != resolution:
+            device_config.update_value("resolution", resolution)
+
+    def initialize(self):
+        """
+        Initializes the panel if it is not already awake.
+        """
+        with self.lock:
+            if not self.panel_ready:
+                if self.epd.init() != 0:
+                    raise RuntimeError("Failed to initialize the display.")
+                self.panel_ready = True
 
     def display_plugin(self, plugin_settings):
         """
@@ -26,23 +59,39 @@ class DisplayManager:
         :param plugin_settings: Dictionary containing plugin settings.
         """
         plugin_id = plugin_settings.get("plugin_id")
-        plugin_config = next((plugin for plugin in self.device_config.get_plugins() if plugin['id'] == plugin_id), None)
+        if self.profiler.is_armed_for(plugin_id):
+            return self.profiler.run(plugin_id, self._display_plugin, plugin_settings)
+        return self._display_plugin(plugin_settings)
+
+    def _display_plugin(self, plugin_settings):
+        plugin_id = plugin_settings.get("plugin_id")
+        plugin_config = self.device_config.get_plugin(plugin_id)
 
         if not plugin_config:
             raise ValueError(f"Plugin '{plugin_id}' not found.")
 
         plugin_instance = get_plugin_instance(plugin_config)
-        image = plugin_instance.generate_image(plugin_settings, self.device_config)
-
-        # Save the image
-        image.save(self.device_config.current_image_file)
-
-        # Resize and adjust orientation
-        image = change_orientation(image, self.device_config.get_config("orientation"))
-        image = resize_image(image, self.device_config.get_resolution(), plugin_config.get('image_settings', []))
+        orientation = self.device_config.get_config("orientation")
+        metadata = {"plugin_id": plugin_id, "orientation": orientation}
+
+        # plugins with pre-rendered frames skip rendering and go straight to the panel
+        start = time.perf_counter()
+        image = None
+        with STAGE_SECONDS.time(stage="generate_frame"):
+            frame = plugin_instance.generate_frame(plugin_settings, self.device_config)
+        if frame is None:
+            with STAGE_SECONDS.time(stage="generate_image"):
+                image = plugin_instance.generate_image(plugin_settings, self.device_config)
+
+            # Resize and adjust orientation
+            frame = self.render_frame(image, plugin_config.get('image_settings', []), orientation)
+        PLUGIN_RENDER_SECONDS.observe(time.perf_counter() - start, plugin_id=plugin_id, source="frame" if image is None else "image")
 
         # Display the image on the Inky display
-        self.epd.display(self.epd.getbuffer(image))
+        self.display_frame(frame)
+
+        # Save the preview and history after the refresh
+        self.history.record(frame, metadata, image)
 
     def display_image(self, image):
         """
@@ -53,14 +102,87 @@ class DisplayManager:
         if not image:
             raise ValueError(f"No image provided.")
 
-        # Save the image
-        image.save(self.device_config.current_image_file)
+        # Display the image on the Inky display
+        frame = self.render_frame(image)
+        self.display_frame(frame, sleep=True)
 
-        # Resize and adjust orientation
-        image = resize_image(image, self.device_config.get_resolution())
+        # Save the preview and history after the refresh
+        self.history.record(frame, {"plugin_id": None, "orientation": None}, image)
 
-        # Display the image on the Inky display
-        self.epd.display(self.epd.getbuffer(image))
-        time.sleep(3)
+    def display_history_frame(self, entry_id):
+        """
+        Displays a frame from the display history again without rendering it.
 
-        self.epd.sleep()
\ No newline at end of file
+        :param entry_id: Id of the history entry.
+        """
+        entry = self.history.get_entry(entry_id)
+        if not entry:
+            raise ValueError(f"History entry {entry_id} not found.")
+
+        frame = self.history.get_frame(entry_id)
+        self.display_frame(frame)
+        # updates the preview and marks the entry as the one on the panel
+        self.history.record_replay(entry_id, frame)
+
+    def render_frame(self, image, image_settings=[], orientation=None):
+        """
+        Resizes the image to the display resolution and packs it into a panel buffer.
+
+        :param image: Pillow Image object.
+        :param image_settings: List of image settings from the plugin config.
+        :param orientation: Device orientation to rotate the image for, if any.
+        :return: The packed frame as bytes.
+        """
+        if orientation:
+            with STAGE_SECONDS.time(stage="change_orientation"):
+                image = change_orientation(image, orientation)
+        with STAGE_SECONDS.time(stage="resize_image"):
+            image = resize_image(image, self.device_config.get_resolution(), image_settings)
+
+        timings = {}
+        frame = self.epd.getbuffer(image, timings)
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        return frame
+
+    def frame_to_image(self, frame):
+        """
+        Decodes a packed frame into an RGB image in the panel's native orientation.
+
+        :param frame: Packed frame as returned by render_frame.
+        :return: Pillow Image object.
+        """
+        packed = np.frombuffer(frame, dtype=np.uint8)
+        pixels = np.empty(packed.size * 2, dtype=np.uint8)
+        pixels[0::2] = packed >> 4
+        pixels[1::2] = packed & 0x0F
+
+        image = Image.frombytes("P", (self.epd.width, self.epd.height), pixels.tobytes())
+        image.putpalette(epd7in3f.PALETTE)
+        return image.convert("RGB")
+
+    def display_frame(self, frame, sleep=False):
+        """
+        Sends a packed frame to the panel.
+
+        :param frame: Packed frame as returned by render_frame.
+        :param sleep: Put the panel into deep sleep after the refresh.
+        """
+        with self.lock:
+            with STAGE_SECONDS.time(stage="initialize"):
+                self.initialize()
+
+            timings = {}
+            self.epd.display(frame, timings)
+            for stage, seconds in timings.items():
+                STAGE_SECONDS.observe(seconds, stage=stage)
+            SPI_BYTES.inc(len(frame))
+            if self.first_frame_time is None:
+                self.first_frame_time = time.monotonic()
+
+            if sleep:
+                time.sleep(3)
+                with STAGE_SECONDS.time(stage="sleep"):
+                    self.epd.sleep()
+                # deep sleep requires a reset and init before the next refresh
+                self.panel_ready = False
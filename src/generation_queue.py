@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+from plugins.plugin_registry import get_plugin_instance
+from utils.generation_store import get_generation_store, get_generation_key, create_generation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 1
+DEFAULT_DAILY_BUDGET = 24
+# seconds to wait before trying again after a failed generation
+RETRY_DELAY = 15 * 60
+# a generation only starts this long before the next scheduled refresh, they take 10-40 seconds
+REFRESH_HEADROOM = 90
+BUDGET_FILE = "generation_budget.json"
+
+class GenerationQueue:
+    def __init__(self, device_config, refresh_task):
+        """
+        Keeps frames of the scheduled AI plugin generated ahead of its refreshes.
+
+        Generations are buffered in the generation store, so the scheduled refresh
+        shows a finished frame instead of waiting for Open AI. Buffers are refilled
+        while no refresh is running or due soon, up to a number of Open AI calls per day,
+        counted in a file under the cache directory.
+
+        :param device_config: The device configuration (Config class).
+        :param refresh_task: The RefreshTask, its refresh_event is set while it is idle.
+        """
+        self.device_config = device_config
+        self.refresh_task = refresh_task
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.retry_after = 0
+        self.budget_file = os.path.join(device_config.cache_dir, BUDGET_FILE)
+
+    def start(self):
+        if not self.thread or not self.thread.is_alive():
+            logger.info("Starting generation queue")
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="generation-queue", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join()
+
+    def notify(self):
+        """Wakes the queue to check its buffer, e.g. after the schedule changed."""
+        with self.condition:
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait(timeout=self.device_config.get_config("scheduler_sleep_time"))
+                if not self.running:
+                    break
+            try:
+                self.refill()
+            except Exception as e:
+                logger.exception(f"Failed to refill generation buffer: {e}")
+
+    def refill(self):
+        """
+        Generates frames for the scheduled plugin until its buffer is full or the daily budget is spent.
+        """
+        buffer_size = int(self.device_config.get_config("generation_buffer_size", default=DEFAULT_BUFFER_SIZE))
+        daily_budget = int(self.device_config.get_config("generation_daily_budget", default=DEFAULT_DAILY_BUDGET))
+
+        refresh_settings = self.device_config.get_config("refresh_settings", default={})
+        settings = refresh_settings.get("plugin_settings")
+        if not buffer_size or not settings or time.time() < self.retry_after:
+            return
+
+        plugin_config = self.device_config.get_plugin(settings.get("plugin_id"))
+        if not plugin_config:
+            return
+        plugin = get_plugin_instance(plugin_config)
+        if not hasattr(plugin, "get_generation_request") or not plugin.render_frame:
+            return
+
+        store = get_generation_store(self.device_config)
+        key, _ = get_generation_key(plugin, settings, self.device_config)
+
+        while self.running and store.count(key, buffered=True) < buffer_size:
+            if self.get_spent_budget() >= daily_budget:
+                logger.info(f"Daily generation budget of {daily_budget} spent, not refilling")
+                return
+
+            # only generate while the display is idle and the next refresh isn't due, a refresh takes priority
+            self.refresh_task.refresh_event.wait()
+            if self.refresh_task.get_seconds_until_refresh() < REFRESH_HEADROOM:
+                logger.debug("Next refresh is due soon, not refilling")
+                return
+
+            # failed calls may be billed as well, every call is counted
+            self.spend_budget()
+            start = time.perf_counter()
+            try:
+                name, _ = create_generation(plugin, settings, self.device_config, buffered=True, source="queue")
+            except Exception as e:
+                logger.error(f"Pre-generation for {plugin_config.get('id')} failed, retrying in {RETRY_DELAY}s: {e}")
+                self.retry_after = time.time() + RETRY_DELAY
+                return
+            logger.info(f"Pre-generated {name} for {plugin_config.get('id')} in {time.perf_counter() - start:.1f}s")
+
+    def get_spent_budget(self):
+        """Returns the number of Open AI calls the queue made today."""
+        today = datetime.date.today().isoformat()
+        try:
+            with open(self.budget_file) as f:
+                budget = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        return budget.get("count", 0) if budget.get("date") == today else 0
+
+    def spend_budget(self):
+        budget = {"date": datetime.date.today().isoformat(), "count": self.get_spent_budget() + 1}
+        os.makedirs(os.path.dirname(self.budget_file), exist_ok=True)
+        tmp_file = self.budget_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(budget, f)
+        os.replace(tmp_file, self.budget_file)
@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 
+# record the start time before the heavier imports below
+import time
+START_TIME = time.monotonic()
+
 # set up logging
 import os, logging.config
 logging.config.fileConfig(os.path.join(os.path.dirname(__file__), 'config', 'logging.conf'))
@@ -14,19 +18,24 @@ import time
 import sys
 import json
 import logging
+import argparse
 import threading
-from utils.app_utils import generate_startup_image
 from flask import Flask, request
-from werkzeug.serving import is_running_from_reloader
 from config import Config
 from display_manager import DisplayManager
 from refresh_task import RefreshTask
+from startup_orchestrator import StartupOrchestrator
+from generation_queue import GenerationQueue
+from utils.network_replay import install_network_replay
+from web_server import run_server, configure_asset_caching, DEFAULT_WORKERS
 from blueprints.main import main_bp
 from blueprints.settings import settings_bp
 from blueprints.plugin import plugin_bp
 from blueprints.display import display_bp
+from blueprints.history import history_bp
+from blueprints.profile import profile_bp
 from jinja2 import ChoiceLoader, FileSystemLoader
-from plugins.plugin_registry import load_plugins
+from plugins.plugin_registry import load_plugins, warm_up_plugins
 
 
 logger = logging.getLogger(__name__)
@@ -38,41 +47,63 @@ template_dirs = [
    os.path.join(os.path.dirname(__file__), "plugins"),      # Plugin templates
 ]
 app.jinja_loader = ChoiceLoader([FileSystemLoader(directory) for directory in template_dirs])
+configure_asset_caching(app)
 
 device_config = Config()
+# optionally record the plugins' network calls or replay them offline
+install_network_replay(device_config)
 display_manager = DisplayManager(device_config)
 refresh_task = RefreshTask(device_config, display_manager)
+startup_orchestrator = StartupOrchestrator(device_config, display_manager, START_TIME)
+generation_queue = GenerationQueue(device_config, refresh_task)
 
-load_plugins(device_config.get_plugins())
+load_plugins(device_config.get_plugins(), secrets=device_config.secrets, render_frame=display_manager.render_frame)
 
 # Store dependencies
 app.config['DEVICE_CONFIG'] = device_config
 app.config['DISPLAY_MANAGER'] = display_manager
 app.config['REFRESH_TASK'] = refresh_task
+app.config['STARTUP_ORCHESTRATOR'] = startup_orchestrator
+app.config['GENERATION_QUEUE'] = generation_queue
 
 # Register Blueprints
 app.register_blueprint(main_bp)
 app.register_blueprint(settings_bp)
 app.register_blueprint(plugin_bp)
 app.register_blueprint(display_bp)
+app.register_blueprint(history_bp)
+app.register_blueprint(profile_bp)
+
+@app.after_request
+def record_response(response):
+    startup_orchestrator.record_response()
+    return response
 
 if __name__ == '__main__':
-    from werkzeug.serving import is_running_from_reloader
+    parser = argparse.ArgumentParser(description="InkyPi web server and display refresh service")
+    parser.add_argument("--dev", action="store_true", help="run the Flask development server instead of the production server")
+    args, _ = parser.parse_known_args()
+
+    # start the background refresh task, neither server uses the reloader so it only runs once
+    refresh_task.start()
+
+    # initialize the panel and show the startup image while the web server comes up
+    startup_orchestrator.start()
 
-    # start the background refresh task
-    if not is_running_from_reloader():
-        refresh_task.start()
+    # optionally import all plugins in the background instead of on first use
+    if device_config.get_config("warm_up_plugins") is True:
+        warm_up_plugins()
 
-    # display default inkypi image on startup
-    if device_config.get_config("startup") is True:
-        logger.info("Startup flag is set, displaying startup image")
-        img = generate_startup_image(device_config.get_resolution())
-        display_manager.display_image(img)
-        device_config.update_value("startup", False)
+    # pre-generate frames of the scheduled AI plugin while the display is idle
+    generation_queue.start()
 
     try:
         # Run the Flask app
         app.secret_key = str(random.randint(100000,999999))
-        app.run(host="0.0.0.0", port=80)
+        if args.dev:
+            app.run(host="0.0.0.0", port=80, use_reloader=False)
+        else:
+            run_server(app, host="0.0.0.0", port=80, workers=int(device_config.get_config("web_server_workers") or DEFAULT_WORKERS))
     finally:
+        generation_queue.stop()
         refresh_task.stop()
\ No newline at end of file
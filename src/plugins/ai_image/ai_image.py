@@ -1,9 +1,9 @@
 import urllib.request
 from plugins.base_plugin.base_plugin import BasePlugin
-from openai import OpenAI
+from utils.generation_store import generate_stored_frame
+from utils.ai_utils import get_client_for_device, decode_image_data
 from PIL import Image
 from io import BytesIO
-import requests
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,9 +14,24 @@ DEFAULT_IMAGE_MODEL = "dall-e-3"
 IMAGE_QUALITIES = ["hd", "standard"]
 DEFAULT_IMAGE_QUALITY = "standard"
 class AIImage(BasePlugin):
+    def get_generation_request(self, settings):
+        """Parameters the generated output depends on, generations are stored by them."""
+        return {
+            "model": settings.get('imageModel', DEFAULT_IMAGE_MODEL),
+            "prompt": settings.get("inputText", ""),
+            "quality": settings.get('quality', DEFAULT_IMAGE_QUALITY),
+            "randomize_prompt": settings.get('randomizePrompt') == 'true'
+        }
+
+    def generate_frame(self, settings, device_config):
+        # generations are pre-generated in the background and kept to replay when Open AI can't be reached
+        if not self.render_frame:
+            return None
+        return generate_stored_frame(self, settings, device_config)
+
     def generate_image(self, settings, device_config):
 
-        api_key = device_config.load_env_key("OPEN_AI_SECRET")
+        api_key = self.get_secret("OPEN_AI_SECRET")
         if not api_key:
             raise RuntimeError("OPEN AI API Key not configured.")
 
@@ -32,7 +47,7 @@ class AIImage(BasePlugin):
 
         image = None
         try:
-            ai_client = OpenAI(api_key = api_key)
+            ai_client = get_client_for_device(api_key, device_config)
             if randomize_prompt:
                 text_prompt = AIImage.fetch_image_prompt(ai_client, text_prompt)
 
@@ -64,16 +79,16 @@ class AIImage(BasePlugin):
             "model": model,
             "prompt": prompt,
             "size": "1024x1024",
-            "quality": "standard"
+            "quality": "standard",
+            # the image is returned in the response instead of a url to download
+            "response_format": "b64_json"
         }
         if model == "dall-e-3":
             args["size"] = "1792x1024" if orientation == "horizontal" else "1024x1792"
             args["quality"] = quality
 
         response = ai_client.images.generate(**args)
-        image_url = response.data[0].url
-        response = requests.get(image_url)
-        img = Image.open(BytesIO(response.content))
+        img = Image.open(BytesIO(decode_image_data(response.data[0])))
 
         return img
 
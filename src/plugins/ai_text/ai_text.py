@@ -1,7 +1,9 @@
 import urllib.request
 from plugins.base_plugin.base_plugin import BasePlugin
-from utils.app_utils import resolve_path, get_font
-from openai import OpenAI
+from utils.app_utils import resolve_path
+from utils.text_utils import get_font, wrap_text, fit_font_size, get_line_height
+from utils.generation_store import generate_stored_frame
+from utils.ai_utils import get_client_for_device
 from PIL import Image, ImageDraw, ImageFont
 from utils.image_utils import resize_image
 from io import BytesIO
@@ -38,8 +40,27 @@ class AIText(BasePlugin):
         template_params['frame_styles'] = FRAME_STYLES
         return template_params
 
+    def get_generation_request(self, settings):
+        """Parameters the generated output depends on, generations are stored by them."""
+        return {
+            "model": settings.get('textModel'),
+            "prompt": settings.get('inputText', ''),
+            # the text is drawn into the frame, so its styling is part of the request
+            "title": settings.get("title"),
+            "frame": settings.get('selectedFrame'),
+            "background_color": settings.get('backgroundColor', "white"),
+            "background_image": settings.get('backgroundImageFile'),
+            "text_color": settings.get('textColor', "black")
+        }
+
+    def generate_frame(self, settings, device_config):
+        # generations are pre-generated in the background and kept to replay when Open AI can't be reached
+        if not self.render_frame:
+            return None
+        return generate_stored_frame(self, settings, device_config)
+
     def generate_image(self, settings, device_config):
-        api_key = device_config.load_env_key("OPEN_AI_SECRET")
+        api_key = self.get_secret("OPEN_AI_SECRET")
         if not api_key:
             raise RuntimeError("OPEN AI API Key not configured.")
 
@@ -58,7 +79,7 @@ class AIText(BasePlugin):
             raise RuntimeError("Text Prompt is required.")
 
         try:
-            ai_client = OpenAI(api_key = api_key)
+            ai_client = get_client_for_device(api_key, device_config)
             prompt_response = AIText.fetch_text_prompt(ai_client, text_model, text_prompt)
         except Exception as e:
             logger.error(f"Failed to make Open AI request: {str(e)}")
@@ -131,24 +152,24 @@ class AIText(BasePlugin):
         dim = min(w,h)
         image_draw = ImageDraw.Draw(base_image)
 
-        # Adaptive font size based on image dimensions
-        font_size = max(10, min(w, h) // 20)
-        font = get_font("jost", font_size)
-        line_height = AIText.get_text_height(font, body) + 4
-
         title_font_size = max(10, min(w, h) // 18)
         title_font = get_font("jost-semibold", title_font_size)
-        title_height = AIText.get_text_height(title_font, title)
+        title_height = AIText.get_text_height(title_font, title) if title else 0
 
         # Maximum text width in pixels
         text_padding = max(dim*0.08, 1)
         max_text_width = w - (text_padding*2)
+        max_text_height = h - (text_padding*2) - title_height
+
+        # Adaptive font size based on image dimensions, shrunk if the response would overflow
+        font_size = fit_font_size(body, "jost", max_text_width, max_text_height, min_size=10, max_size=max(10, min(w, h) // 20), line_spacing=4)
+        font = get_font("jost", font_size)
+        line_height = get_line_height(font, 4)
 
-        wrapped_lines = AIText.wrap_lines(body, image_draw, font, max_text_width)
+        wrapped_lines = wrap_text(body, font, max_text_width)
 
         total_text_height = len(wrapped_lines) * line_height
 
-        title_height = title_height if title else 0
         y = max((h - total_text_height - title_height) // 2, 0)
         x = w/2
 
@@ -182,26 +203,6 @@ class AIText(BasePlugin):
 
         return image
 
-    @staticmethod
-    def wrap_lines(body, image_draw, font, max_text_width):        
-        # Word-wrap text using pixel-based constraints
-        words = body.replace("\n", " \n").split(" ")
-        wrapped_lines = []
-        current_line = []
-
-        for word in words:
-            test_line = ' '.join(current_line + [word])
-            test_width = image_draw.textlength(test_line.replace("\n", ""), font=font)
-            if test_width <= max_text_width and "\n" not in word:
-                current_line.append(word)
-            else:
-                wrapped_lines.append(' '.join(current_line))
-                current_line = [word.replace("\n", "")]
-
-        if current_line:
-            wrapped_lines.append(' '.join(current_line))
-        return wrapped_lines
-    
     @staticmethod
     def get_text_height(font, text):        
         # Word-wrap text using pixel-based constraints
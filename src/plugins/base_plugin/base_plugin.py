@@ -1,5 +1,6 @@
 import logging
 import os
+from config import SecretsProvider
 from utils.app_utils import resolve_path
 from pathlib import Path
 
@@ -11,10 +12,25 @@ class BasePlugin:
     """Base class for all plugins."""
     def __init__(self, config, **dependencies):
         self.config = config
+        # shared, cached .env secrets injected by the plugin registry
+        self.secrets = dependencies.get("secrets") or SecretsProvider()
+        # packs images into panel frames, used by plugins that pre-render frames
+        self.render_frame = dependencies.get("render_frame")
+
+    def get_secret(self, key):
+        return self.secrets.get(key)
 
     def generate_image(self, settings, device_config):
         raise NotImplementedError("generate_image must be implemented by subclasses")
     
+    def generate_frame(self, settings, device_config):
+        """Return a pre-rendered packed frame to display instead of calling generate_image, or None."""
+        return None
+
+    def on_upload(self, file_path, device_config):
+        """Called with each image uploaded with the plugin's settings, e.g. to pre-render its frames."""
+        pass
+
     def generate_settings_template(self):
         template_params = {"settings_template": "base_plugin/settings.html"}
 
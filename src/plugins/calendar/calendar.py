@@ -1,35 +1,43 @@
 import os
-from ics import Calendar as icsCal
+import time
+import pickle
+import hashlib
+import logging
 import requests
 import datetime
 import pytz
+import math
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from utils.app_utils import get_font
+from utils.text_utils import get_font, wrap_text, get_line_height
+from utils.metrics import record_cache_lookup
 from PIL import Image, ImageDraw, ImageFont
 from plugins.base_plugin.base_plugin import BasePlugin
+from plugins.calendar.ics_reader import read_components, decode_lines
+from plugins.calendar.event_index import EventIndex
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for the calendar server
+FEED_TIMEOUT = 30
+# feeds are read and scanned in chunks of this many bytes
+FEED_CHUNK_SIZE = 64 * 1024
+# feeds are fetched concurrently, at most this many at once
+MAX_FEEDS = 5
+FEED_WORKERS = 3
+# parsed feeds are kept between renders and restarts, bump when the cached format changes
+FEED_CACHE_DIR = "calendar"
+FEED_CACHE_VERSION = 2
 
 class Calendar(BasePlugin):
     def __init__(self, config, **dependencies):
         super().__init__(config, **dependencies)
-
-    def wrap_text(self, text, font, max_width):
-        words = text.split()
-        lines = list()
-        current_line = ""
-
-        
-        for word in words:
-            if font.getlength(current_line + word) <= max_width:
-                current_line = current_line + word + " "
-            else:
-                lines.append(current_line)
-                current_line = word + " "  # Reset current_line correctly
-        lines.append(current_line)  # Append the last line
-        return '\n'.join(lines)
+        # event index and validators of each feed, keyed by url
+        self.feed_cache = {}
 
     def generate_image(self, settings, device_config):
         background_color = settings.get('backgroundColor', "white")
-        ical_url = settings.get('inputText', '')
 
         # Retrieve display settings
         start_time = int(settings.get('startTime', 8))  # Default to 8 if not provided
@@ -41,13 +49,13 @@ class Calendar(BasePlugin):
         title_text_size = int(settings.get('titleTextSize', 18))
         event_text_size = int(settings.get('eventTextSize', 14))
         grid_color = settings.get('gridColor', "#000000")
-        event_color = settings.get('eventColor', "#00ff00")
         event_text_color = settings.get('eventTextColor', "#ffffff")
         legend_color = settings.get('legendColor', "#000000")
 
         width,height = device_config.get_resolution()
 
-        if not ical_url:
+        feeds = self.get_feeds(settings)
+        if not feeds:
             # Handle the case where the URL is not provided
             img = Image.new('RGBA', device_config.get_resolution(), background_color)
             draw = ImageDraw.Draw(img)
@@ -56,13 +64,15 @@ class Calendar(BasePlugin):
             return img
         
         try:
-            calendar = icsCal(requests.get(ical_url).text)
-            events = calendar.events
-
             # Get today's date in the Vancouver timezone
             vancouver_timezone = pytz.timezone("America/Vancouver")
             today = datetime.datetime.now(vancouver_timezone)
 
+            # only events overlapping the displayed days are read from the feed
+            window_start = vancouver_timezone.localize(datetime.datetime.combine(today.date(), datetime.time.min))
+            window_end = vancouver_timezone.normalize(window_start + datetime.timedelta(days=days_to_show))
+            indexes, failed_feeds = self.fetch_feeds(feeds, window_start, window_end, vancouver_timezone, device_config.cache_dir)
+
             # Image generation (similar to before)
             img = Image.new('RGBA', device_config.get_resolution(), background_color)
             draw = ImageDraw.Draw(img)
@@ -111,49 +121,75 @@ class Calendar(BasePlugin):
                 y_pos = grid_start_y + i * cell_height  # Align with horizontal line
                 draw.text((grid_start_x - 35, y_pos), hour_str, font=titleFont, fill=legend_color)
 
-            # Filter events for the next days
-            end_of_week = today + datetime.timedelta(days=days_to_show - 1)
-
-            events_this_week = [
-                event for event in events
-                if today.date() <= event.begin.datetime.astimezone(vancouver_timezone).date() <= end_of_week.date()
-                and (event.begin.datetime.astimezone(vancouver_timezone).date() == event.end.datetime.astimezone(vancouver_timezone).date())
-            ]
-
             # --- Draw Events ---
-            if not events_this_week:
-                draw.text((grid_start_x, grid_start_y), 'No upcoming events found.', font=titleFont, fill=0)
-            else:
-                for event in events_this_week:
-                    # Access event data using properties
-                    start_dt = event.begin.datetime.astimezone(vancouver_timezone)  # Get start time as datetime object
-                    end_dt = event.end.datetime.astimezone(vancouver_timezone)    # Get end time as datetime object
+            line_height = get_line_height(textFont) + 6
+            found_events = False
+            for day_offset in range(days_to_show):
+                day = today.date() + datetime.timedelta(days=day_offset)
+                # events of all feeds for the day, merged by start time
+                day_events = list(heapq.merge(
+                    *([(event, event_color) for event in index.events_on_day(day, vancouver_timezone)] for index, event_color in indexes),
+                    key=lambda item: item[0].begin
+                ))
+                found_events = found_events or bool(day_events)
+                x_pos = grid_start_x + day_offset * cell_width
 
-                    # Calculate event position and duration
-                    day_offset = (start_dt.weekday() - today.weekday()) % days_to_show  # Adjust for week wrapping
-                    x_pos = grid_start_x + day_offset * cell_width
+                # visible hours of the day, events are clipped to them
+                day_start = vancouver_timezone.localize(datetime.datetime.combine(day, datetime.time.min))
+                visible_start = vancouver_timezone.normalize(day_start + datetime.timedelta(hours=start_time))
+                visible_end = vancouver_timezone.normalize(day_start + datetime.timedelta(hours=end_time + 1))
 
-                    # Calculate y_pos with minute precision
-                    y_pos = grid_start_y + (start_dt.hour - start_time) * cell_height + (start_dt.minute / 60) * cell_height
-
-                    event_duration_hours = (end_dt - start_dt).total_seconds() / 3600
-                    event_height = event_duration_hours * cell_height
-
-                    # Draw the event rectangle
-                    if start_time <= start_dt.hour <= end_time or start_time <= end_dt.hour <= end_time:
+                all_day_count = 0
+                for event, event_color in day_events:
+                    if event.all_day:
+                        # all day events are stacked as bars at the top of the day
+                        y_pos = grid_start_y + all_day_count * line_height
+                        all_day_count += 1
                         draw.rounded_rectangle(
-                            [
-                                (x_pos, y_pos),
-                                (x_pos + cell_width, y_pos + event_height)
-                            ],
-                            event_card_radius,
+                            [(x_pos, y_pos), (x_pos + cell_width, y_pos + line_height)],
+                            event_card_radius // 2,
                             outline=0,
                             fill=event_color
                         )
+                        label = wrap_text(event.name or '', textFont, cell_width - 10)[0]
+                        draw.text((x_pos + 5, y_pos + 3), label, font=textFont, fill=event_text_color)
+                        continue
+
+                    start_dt = max(event.begin, visible_start)
+                    end_dt = min(event.end, visible_end)
+                    if start_dt >= visible_end or end_dt < start_dt:
+                        continue
 
-                        # Draw event summary with wrapping
-                        wrapped_text = self.wrap_text(event.name, textFont, cell_width - 10)
-                        draw.multiline_text((x_pos + 5, y_pos + 5), wrapped_text, font=textFont, fill=event_text_color)
+                    # Calculate y_pos with minute precision
+                    y_pos = grid_start_y + (start_dt - visible_start).total_seconds() / 3600 * cell_height
+                    event_height = (end_dt - start_dt).total_seconds() / 3600 * cell_height
+
+                    # Draw the event rectangle
+                    draw.rounded_rectangle(
+                        [
+                            (x_pos, y_pos),
+                            (x_pos + cell_width, y_pos + event_height)
+                        ],
+                        event_card_radius,
+                        outline=0,
+                        fill=event_color
+                    )
+
+                    # Draw event summary with wrapping
+                    wrapped_text = '\n'.join(wrap_text(event.name or '', textFont, cell_width - 10))
+                    draw.multiline_text((x_pos + 5, y_pos + 5), wrapped_text, font=textFont, fill=event_text_color)
+
+            if not found_events:
+                draw.text((grid_start_x, grid_start_y), 'No upcoming events found.', font=titleFont, fill=0)
+
+            # --- Failed Feeds ---
+            # a "!" with a swatch of each feed that could not be fetched, in the top left corner
+            if failed_feeds:
+                draw.text((4, 2), "!", font=titleFont, fill=legend_color)
+                for i, (_, feed_color) in enumerate(failed_feeds):
+                    x_pos = 12 + (i % 3) * 9
+                    y_pos = 6 + (i // 3) * 9
+                    draw.rectangle([(x_pos, y_pos), (x_pos + 7, y_pos + 7)], outline=legend_color, fill=feed_color)
 
             return img
         except requests.exceptions.RequestException as e:
@@ -164,5 +200,154 @@ class Calendar(BasePlugin):
             draw.text((10, 10), f"Error fetching iCal: {e}", font=font, fill=0)
             return img
 
+    @staticmethod
+    def get_feeds(settings):
+        """
+        Returns the (url, color) of each configured feed.
+
+        The first feed uses the inputText and eventColor settings, further feeds add
+        the feed number to the names, e.g. inputText2 and eventColor2.
+        """
+        feeds = []
+        for i in range(1, MAX_FEEDS + 1):
+            suffix = str(i) if i > 1 else ""
+            url = settings.get(f"inputText{suffix}", "").strip()
+            if url and url not in (feed_url for feed_url, _ in feeds):
+                feeds.append((url, settings.get(f"eventColor{suffix}") or "#00ff00"))
+        return feeds
+
+    def fetch_feeds(self, feeds, window_start, window_end, tz, cache_dir):
+        """
+        Fetches the event indexes of the feeds concurrently.
+
+        A feed that fails or doesn't finish within FEED_TIMEOUT is left out,
+        the request is only raised if every feed failed.
+
+        :return: Tuple of the list of (EventIndex, color) and the list of failed (url, color).
+        """
+        workers = min(FEED_WORKERS, len(feeds))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="calendar-feed")
+        futures = [
+            executor.submit(self.get_event_index, url, window_start, window_end, tz, cache_dir)
+            for url, _ in feeds
+        ]
+        # requests time out on their own, this also bounds feeds that keep trickling data
+        # and leaves time for feeds waiting on a worker
+        wait(futures, timeout=FEED_TIMEOUT * math.ceil(len(feeds) / workers))
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        indexes = []
+        failed_feeds = []
+        error = None
+        for (url, color), future in zip(feeds, futures):
+            if not future.done() or future.cancelled():
+                logger.error(f"Timed out fetching calendar feed {url}")
+                failed_feeds.append((url, color))
+            elif future.exception():
+                error = future.exception()
+                logger.error(f"Failed to fetch calendar feed {url}: {error}")
+                failed_feeds.append((url, color))
+            else:
+                indexes.append((future.result(), color))
+
+        if not indexes:
+            raise error or requests.exceptions.Timeout("Timed out fetching the calendar feeds.")
+        return indexes, failed_feeds
+
+    def get_event_index(self, ical_url, window_start, window_end, tz, cache_dir):
+        """
+        Returns the EventIndex of the feed for the window.
+
+        The index and the feed validators are persisted under cache_dir. A feed that is
+        unchanged according to its ETag/Last-Modified headers or its content hash is not
+        read again, a changed feed only expands the events that were added or modified.
+        """
+        cached = self.feed_cache.get(ical_url)
+        if cached is None:
+            cached = self.load_feed_cache(ical_url, cache_dir)
+        index = cached["index"] if cached else None
+        if index and not index.covers(window_start, window_end, tz):
+            cached = None
+            index = None
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        with requests.get(ical_url, headers=headers, timeout=FEED_TIMEOUT, stream=True) as response:
+            if response.status_code == 304 and cached:
+                logger.info("Calendar feed not modified, using cached events")
+                record_cache_lookup("calendar_feed", True)
+                self.feed_cache[ical_url] = cached
+                return index
+            response.raise_for_status()
+
+            # the feed is scanned while it downloads, only unchanged events are skipped
+            start = time.perf_counter()
+            feed_hash = hashlib.sha256()
+            feed_size = 0
+            def read_chunks():
+                nonlocal feed_size
+                for chunk in response.iter_content(chunk_size=FEED_CHUNK_SIZE):
+                    feed_hash.update(chunk)
+                    feed_size += len(chunk)
+                    yield chunk
+
+            if index is None:
+                index = EventIndex(window_start, window_end, tz.zone)
+            parsed = index.update(read_components(decode_lines(read_chunks())), tz)
+
+        content_hash = feed_hash.hexdigest()
+        unchanged = bool(cached and cached["content_hash"] == content_hash)
+        record_cache_lookup("calendar_feed", unchanged)
+        if unchanged:
+            logger.info("Calendar feed content unchanged, using cached events")
+        else:
+            logger.info(f"Indexed {len(index.events)} events from {feed_size // 1024} KiB calendar feed, "
+                        f"{parsed} events parsed in {time.perf_counter() - start:.2f}s")
+
+        cached = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+            "index": index
+        }
+        self.feed_cache[ical_url] = cached
+        self.save_feed_cache(ical_url, cache_dir, cached)
+        return index
+
+    @staticmethod
+    def get_feed_cache_file(ical_url, cache_dir):
+        return os.path.join(cache_dir, FEED_CACHE_DIR, hashlib.sha1(ical_url.encode()).hexdigest()[:16] + ".pickle")
+
+    @staticmethod
+    def load_feed_cache(ical_url, cache_dir):
+        file_path = Calendar.get_feed_cache_file(ical_url, cache_dir)
+        if not os.path.isfile(file_path):
+            return None
+        try:
+            with open(file_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") != FEED_CACHE_VERSION:
+                return None
+            return cached
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable calendar cache {file_path}: {e}")
+            return None
+
+    @staticmethod
+    def save_feed_cache(ical_url, cache_dir, cached):
+        file_path = Calendar.get_feed_cache_file(ical_url, cache_dir)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({**cached, "version": FEED_CACHE_VERSION}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            logger.warning(f"Failed to save calendar cache {file_path}: {e}")
+
     def generate_settings_template(self):
         return {"settings_template": "calendar/settings.html"}
\ No newline at end of file
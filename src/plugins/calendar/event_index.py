@@ -0,0 +1,119 @@
+import hashlib
+import datetime
+import logging
+from bisect import bisect_left
+from plugins.calendar.ics_reader import parse_component, get_date_range, get_recurrence_key, build_events
+
+logger = logging.getLogger(__name__)
+
+# events up to this long are kept in the sorted index, longer ones are checked one by one
+MAX_INDEXED_DURATION = datetime.timedelta(days=1).total_seconds()
+
+class EventIndex:
+    """
+    Events of one feed overlapping a display window, sorted by start time.
+
+    The expanded events of each VEVENT are kept by a hash of its content lines, so
+    updating the index with a changed feed only parses and expands the events that
+    were added or modified. Past and future VEVENTs without occurrences in the window
+    only cost their hash. Queries use bisect on the start times, events longer than a day are kept
+    in a separate list so they don't widen the search of short events.
+    """
+
+    def __init__(self, window_start, window_end, timezone):
+        self.window_start = window_start
+        self.window_end = window_end
+        self.timezone = timezone
+        # hash of the content lines of each VEVENT -> (events in the window, recurrence key)
+        self.components = {}
+        self.events = []
+        self._begins = []
+        self._short_events = []
+        self._long_events = []
+
+    def covers(self, window_start, window_end, tz):
+        return self.timezone == tz.zone and self.window_start <= window_start and window_end <= self.window_end
+
+    def update(self, components, tz):
+        """
+        Replaces the indexed events with the events of the given VEVENTs.
+
+        :param components: Iterable of content line tuples as returned by read_components.
+        :return: Number of VEVENTs that had to be parsed and expanded.
+        """
+        date_range = get_date_range(self.window_start, self.window_end)
+        # the index is only replaced once all components were read, a failed read keeps it intact
+        components_by_hash = {}
+        # (uid, original start) of occurrences replaced by a modified instance
+        replaced = set()
+        parsed = 0
+
+        for component in components:
+            key = hashlib.sha1("\n".join(component).encode()).digest()
+            entry = self.components.get(key)
+            if entry is None:
+                properties = parse_component(component)
+                recurrence_key = get_recurrence_key(properties, tz)
+                if recurrence_key:
+                    # a modified instance replaces its occurrence even if it moved out of the window
+                    replaced.add(recurrence_key)
+                events = build_events(properties, self.window_start, self.window_end, date_range, tz)
+                parsed += 1
+                # VEVENTs without occurrences in the window are kept too, so they aren't parsed again
+                entry = (events or (), recurrence_key)
+            elif entry[1]:
+                replaced.add(entry[1])
+            components_by_hash[key] = entry
+
+        self.components = components_by_hash
+        events = [
+            event for entry_events, _ in self.components.values() for event in entry_events
+            if event.recurrence_id is None or (event.uid, event.recurrence_id) not in replaced
+        ]
+        self._set_events(events)
+        return parsed
+
+    def _set_events(self, events):
+        events.sort(key=lambda event: event.begin)
+        self.events = events
+        short_events = []
+        self._long_events = []
+        for event in events:
+            if (event.end - event.begin).total_seconds() > MAX_INDEXED_DURATION:
+                self._long_events.append(event)
+            else:
+                short_events.append(event)
+        self._short_events = short_events
+        self._begins = [event.begin.timestamp() for event in short_events]
+
+    def query(self, start, end):
+        """
+        Returns the events overlapping [start, end), sorted by start time.
+        """
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        low = bisect_left(self._begins, start_ts - MAX_INDEXED_DURATION)
+        high = bisect_left(self._begins, end_ts)
+
+        events = [event for event in self._short_events[low:high] if self._overlaps(event, start_ts, end_ts)]
+        long_events = [event for event in self._long_events if self._overlaps(event, start_ts, end_ts)]
+        if long_events:
+            events = sorted(events + long_events, key=lambda event: event.begin)
+        return events
+
+    def events_on_day(self, day, tz):
+        """Returns the events overlapping the given date in tz."""
+        day_start = tz.localize(datetime.datetime.combine(day, datetime.time.min))
+        day_end = tz.localize(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+        return self.query(day_start, day_end)
+
+    def events_in_hour(self, day, hour, tz):
+        """Returns the events overlapping the given hour of a date in tz."""
+        hour_start = tz.localize(datetime.datetime.combine(day, datetime.time(hour)))
+        return self.query(hour_start, tz.normalize(hour_start + datetime.timedelta(hours=1)))
+
+    @staticmethod
+    def _overlaps(event, start_ts, end_ts):
+        begin, end = event.begin.timestamp(), event.end.timestamp()
+        if begin == end:
+            return start_ts <= begin < end_ts
+        return begin < end_ts and end > start_ts
@@ -0,0 +1,263 @@
+import re
+import codecs
+import logging
+import datetime
+import pytz
+from dateutil.rrule import rrulestr
+
+logger = logging.getLogger(__name__)
+
+DURATION_PATTERN = re.compile(r"([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
+EVENT_PROPERTIES = {"UID", "SUMMARY", "DTSTART", "DTEND", "DURATION", "RRULE", "EXDATE", "RECURRENCE-ID"}
+# properties that may occur more than once in an event
+LIST_PROPERTIES = {"EXDATE"}
+
+class CalendarEvent:
+    """
+    A single event or occurrence, with begin and end converted to the display timezone.
+
+    recurrence_id is the original start timestamp of an occurrence expanded from a
+    recurrence rule, so occurrences replaced by a modified instance can be dropped.
+    """
+    __slots__ = ("uid", "name", "begin", "end", "all_day", "recurrence_id")
+
+    def __init__(self, uid, name, begin, end, all_day=False, recurrence_id=None):
+        self.uid = uid
+        self.name = name
+        self.begin = begin
+        self.end = end
+        self.all_day = all_day
+        self.recurrence_id = recurrence_id
+
+def decode_lines(chunks, encoding="utf-8"):
+    """
+    Split a feed read in byte chunks into lines, holding only the current chunk and line in memory.
+
+    :param chunks: Iterable of bytes, e.g. a streamed response's iter_content.
+    :return: Generator of lines without line endings.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+def unfold_lines(lines):
+    """Join folded content lines, continuation lines start with a space or tab."""
+    current = None
+    for line in lines:
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line.rstrip()
+    if current is not None:
+        yield current
+
+def parse_property(line):
+    """Split a content line into its name, parameters and value."""
+    name_part, _, value = line.partition(":")
+    name, *params = name_part.split(";")
+    return name.upper(), dict(param.partition("=")[::2] for param in params), value
+
+def unescape_text(value):
+    return (value.replace("\\n", "\n").replace("\\N", "\n")
+        .replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\"))
+
+def parse_local_datetime(value, params, tz):
+    """
+    Parse a DATE or DATE-TIME value into a naive datetime and the timezone it is in.
+
+    :return: Tuple of the naive datetime, its timezone and whether the value was a date (all day).
+    """
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.datetime.strptime(value[:8], "%Y%m%d"), tz, True
+
+    dt = datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return dt, pytz.utc, False
+    try:
+        return dt, pytz.timezone(params["TZID"].strip('"')), False
+    except (KeyError, pytz.UnknownTimeZoneError):
+        # floating times and unknown (e.g. Windows) timezone names use the display timezone
+        return dt, tz, False
+
+def parse_datetime(value, params, tz):
+    """
+    Parse a DATE or DATE-TIME value into an aware datetime in tz.
+
+    :return: Tuple of the datetime and whether the value was a date (all day).
+    """
+    dt, source_tz, all_day = parse_local_datetime(value, params, tz)
+    return source_tz.localize(dt).astimezone(tz), all_day
+
+def parse_duration(value):
+    match = DURATION_PATTERN.fullmatch(value.strip())
+    if not match:
+        return datetime.timedelta()
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = datetime.timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                                  minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == "-" else duration
+
+def read_components(lines):
+    """
+    Scan the VEVENT blocks of an iCalendar feed.
+
+    Only the content lines needed for rendering are kept, properties of nested
+    components (e.g. VALARM) are skipped.
+
+    :param lines: Iterable of content lines of the feed.
+    :return: Generator of tuples of content lines, one per event.
+    """
+    component = None
+    # depth of components nested in the event
+    nested = 0
+    for line in unfold_lines(lines):
+        if component is None:
+            if line == "BEGIN:VEVENT":
+                component = []
+            continue
+
+        if line.startswith("BEGIN:"):
+            nested += 1
+        elif line.startswith("END:") and nested:
+            nested -= 1
+        elif line == "END:VEVENT":
+            yield tuple(component)
+            component = None
+        elif not nested and line.partition(":")[0].partition(";")[0].upper() in EVENT_PROPERTIES:
+            component.append(line)
+
+def parse_component(component):
+    """Parse the content lines of an event into a dict of name to (params, value)."""
+    properties = {}
+    for line in component:
+        name, params, value = parse_property(line)
+        if name in LIST_PROPERTIES:
+            properties.setdefault(name, []).append((params, value))
+        else:
+            properties[name] = (params, value)
+    return properties
+
+def get_date_range(window_start, window_end):
+    """Dates bounding the window as text, with a day of slack for timezone offsets."""
+    return (
+        (window_start - datetime.timedelta(days=1)).strftime("%Y%m%d"),
+        (window_end + datetime.timedelta(days=1)).strftime("%Y%m%d")
+    )
+
+def get_recurrence_key(properties, tz):
+    """
+    The uid and original start timestamp replaced by a modified instance of a recurring event.
+
+    :return: Tuple of uid and timestamp or None if the event is not a modified instance.
+    """
+    if "RECURRENCE-ID" not in properties:
+        return None
+    params, value = properties["RECURRENCE-ID"]
+    try:
+        recurrence_id, _ = parse_datetime(value, params, tz)
+    except ValueError:
+        return None
+    return properties.get("UID", ({}, ""))[1], recurrence_id.timestamp()
+
+def build_events(properties, window_start, window_end, date_range, tz):
+    """
+    Build the events or expanded occurrences of a parsed VEVENT overlapping the window.
+
+    The date part of DTSTART and DTEND is compared as text first, so most events outside
+    of the window are skipped without parsing their dates. Recurrence rules are expanded
+    only between the start of the window, less the event duration, and its end.
+
+    :param date_range: Date bounds of the window as returned by get_date_range.
+    :return: List of CalendarEvent.
+    """
+    if "DTSTART" not in properties:
+        return []
+    start_params, start_value = properties["DTSTART"]
+    recurring = "RRULE" in properties
+    if start_value[:8] > date_range[1]:
+        return []
+    if not recurring and "DTEND" in properties and properties["DTEND"][1][:8] < date_range[0]:
+        return []
+
+    try:
+        local_begin, source_tz, all_day = parse_local_datetime(start_value, start_params, tz)
+        begin = source_tz.localize(local_begin).astimezone(tz)
+        if "DTEND" in properties:
+            end, _ = parse_datetime(properties["DTEND"][1], properties["DTEND"][0], tz)
+            duration = end - begin
+        elif "DURATION" in properties:
+            duration = parse_duration(properties["DURATION"][1])
+        else:
+            duration = datetime.timedelta(days=1) if all_day else datetime.timedelta()
+    except ValueError as e:
+        logger.warning(f"Skipping event with invalid dates: {e}")
+        return []
+
+    uid = properties.get("UID", ({}, ""))[1]
+    name = unescape_text(properties.get("SUMMARY", ({}, ""))[1])
+
+    if not recurring:
+        end = tz.normalize(begin + duration)
+        if begin >= window_end or (end <= window_start and begin < window_start):
+            return []
+        return [CalendarEvent(uid, name, begin, end, all_day)]
+
+    try:
+        occurrences = expand_rule(properties, local_begin, source_tz, duration, window_start, window_end, tz)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Skipping event '{name}' with invalid recurrence rule: {e}")
+        return []
+
+    events = []
+    for occurrence in occurrences:
+        end = tz.normalize(occurrence + duration)
+        if occurrence >= window_end or (end <= window_start and occurrence < window_start):
+            continue
+        events.append(CalendarEvent(uid, name, occurrence, end, all_day, occurrence.timestamp()))
+    return events
+
+def expand_rule(properties, local_begin, source_tz, duration, window_start, window_end, tz):
+    """
+    Expand the RRULE of an event into the start times of its occurrences near the window.
+
+    The rule is expanded on naive wall clock times of the event's own timezone, so
+    occurrences keep their local time across daylight saving changes.
+
+    :return: List of aware occurrence starts in tz, excluding EXDATEs.
+    """
+    rule = rrulestr(localize_until(properties["RRULE"][1], source_tz), dtstart=local_begin)
+    search_start = (window_start.astimezone(source_tz) - duration).replace(tzinfo=None)
+    search_end = window_end.astimezone(source_tz).replace(tzinfo=None)
+
+    excluded = set()
+    for params, value in properties.get("EXDATE", []):
+        for exdate in value.split(","):
+            if exdate.strip():
+                excluded.add(parse_datetime(exdate, params, tz)[0].timestamp())
+
+    occurrences = []
+    for local_start in rule.between(search_start, search_end, inc=True):
+        start = source_tz.localize(local_start).astimezone(tz)
+        if start.timestamp() not in excluded:
+            occurrences.append(start)
+    return occurrences
+
+def localize_until(rule_value, source_tz):
+    """Convert a UTC UNTIL of a recurrence rule to the naive local time the rule is expanded in."""
+    parts = rule_value.split(";")
+    for i, part in enumerate(parts):
+        key, _, value = part.partition("=")
+        if key.upper() == "UNTIL" and value.upper().endswith("Z"):
+            until = pytz.utc.localize(datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S"))
+            parts[i] = "UNTIL=" + until.astimezone(source_tz).strftime("%Y%m%dT%H%M%S")
+    return ";".join(parts)
@@ -1,11 +1,15 @@
 import os
-from utils.app_utils import resolve_path, get_font
+from utils.app_utils import resolve_path
+from utils.text_utils import get_font
 from plugins.base_plugin.base_plugin import BasePlugin
+from plugins.clock.frame_bank import WordClockFrameBank
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
 import logging
 import numpy as np
 import math
+from time import perf_counter
+from functools import lru_cache
 from datetime import datetime
 import pytz
 
@@ -33,12 +37,64 @@ CLOCK_FACES = [
 DEFAULT_TIMEZONE = "US/Eastern"
 DEFAULT_CLOCK_FACE = "Gradient Clock"
 
+WORD_CLOCK_COLORS = ((0,0,0), (255,255,255))
+FRAME_BANK_DIR = "clock"
+
+WORD_CLOCK_GRID = [
+    ['I','T','L','I','S','A','S','A','M','P','M'],
+    ['A','C','Q','U','A','R','T','E','R','D','C'],
+    ['T','W','E','N','T','Y','F','I','V','E','X'],
+    ['H','A','L','F','S','T','E','N','F','T','O'],
+    ['P','A','S','T','E','R','U','N','I','N','E'],
+    ['O','N','E','S','I','X','T','H','R','E','E'],
+    ['F','O','U','R','F','I','V','E','T','W','O'],
+    ['E','I','G','H','T','E','L','E','V','E','N'],
+    ['S','E','V','E','N','T','W','E','L','V','E'],
+    ['T','E','N','S','E','O','C','L','O','C','K'],
+]
+
+# angle bins of the gradient clock, fine enough to keep sweep edges within half a pixel
+ANGLE_BINS = 8192
+
 class Clock(BasePlugin):
     def generate_settings_template(self):
         template_params = super().generate_settings_template()
         template_params['clock_faces'] = CLOCK_FACES
         return template_params
 
+    def __init__(self, config, **dependencies):
+        super().__init__(config, **dependencies)
+        self.frame_banks = {}
+
+    def generate_frame(self, settings, device_config):
+        if settings.get('selectedClockFace') != "Word Clock" or settings.get('useFrameBank') != 'true':
+            return None
+        if not self.render_frame:
+            return None
+
+        resolution = device_config.get_resolution()
+        orientation = device_config.get_config("orientation")
+        # banked frames go through the same image settings as frames rendered live
+        image_settings = self.config.get('image_settings', [])
+        key = WordClockFrameBank.get_key(resolution, orientation, *WORD_CLOCK_COLORS, image_settings)
+        bank = self.frame_banks.get(key)
+        if not bank:
+            bank = WordClockFrameBank(os.path.join(device_config.cache_dir, FRAME_BANK_DIR), key)
+            self.frame_banks[key] = bank
+
+        if not bank.is_ready():
+            # render normally until the bank has been built in the background
+            dimensions = resolution[::-1] if orientation == "vertical" else resolution
+            bank.build_async(
+                lambda time: self.render_frame(self.draw_word_clock(dimensions, time, *WORD_CLOCK_COLORS), image_settings, orientation),
+                Clock.translate_word_grid_positions
+            )
+            return None
+
+        timezone_name = device_config.get_config("timezone") or DEFAULT_TIMEZONE
+        current_time = datetime.now(pytz.timezone(timezone_name))
+        return bank.get_frame(current_time.hour, current_time.minute)
+
     def generate_image(self, settings, device_config):
         clock_face = settings.get('selectedClockFace')
         if not clock_face or clock_face not in [face['name'] for face in CLOCK_FACES]:
@@ -53,6 +109,7 @@ class Clock(BasePlugin):
         current_time = datetime.now(tz)
 
         img = None
+        start = perf_counter()
         try:
             if clock_face == "Gradient Clock":
                 img = self.draw_conic_clock(dimensions, current_time)
@@ -65,42 +122,52 @@ class Clock(BasePlugin):
         except Exception as e:
             logger.error(f"Failed to draw clock image: {str(e)}")
             raise RuntimeError("Failed to display clock.")
+        logger.info(f"Drew {clock_face} in {(perf_counter() - start) * 1000:.0f} ms")
         return img
     
     def draw_digital_clock(self, dimensions, time, primary_color=(255,255,255), secondary_color=(0,0,0)):
         w,h = dimensions
         time_str = Clock.format_time(time.hour, time.minute, zero_pad = True)
 
-        image = Image.new("RGBA", dimensions, secondary_color+(255,))
-        text = Image.new("RGBA", dimensions, (0, 0, 0, 0))
+        image = Clock.draw_digital_clock_face(tuple(dimensions), primary_color, secondary_color)
+        text = Image.new("RGBA", image.size, (0, 0, 0, 0))
 
         font_size = w * 0.36
         fnt = get_font("ds-gigi", font_size)
         text_draw = ImageDraw.Draw(text)
 
         # time text
-        text_draw.text((w/2, h/2), "00:00", font=fnt, anchor="mm", fill=primary_color +(30,))
         text_draw.text((w/2, h/2), time_str, font=fnt, anchor="mm", fill=primary_color +(255,))
 
         combined = Image.alpha_composite(image, text)    
 
         return combined
+
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def draw_digital_clock_face(dimensions, primary_color, secondary_color):
+        """
+        Background and dimmed "00:00" segments of the digital clock, shared by every render.
+        """
+        w,h = dimensions
+        image = Image.new("RGBA", dimensions, secondary_color+(255,))
+        text = Image.new("RGBA", dimensions, (0, 0, 0, 0))
+
+        font_size = w * 0.36
+        fnt = get_font("ds-gigi", font_size)
+        text_draw = ImageDraw.Draw(text)
+        text_draw.text((w/2, h/2), "00:00", font=fnt, anchor="mm", fill=primary_color +(30,))
+
+        return Image.alpha_composite(image, text)
         
     def draw_conic_clock(self, dimensions, time, primary_color=(219, 50, 70, 255), secondary_color=(0, 0, 0, 255) ):
         width, height = dimensions
         hour_angle, minute_angle = Clock.calculate_clock_angles(time)
 
-        # Draw the hour hand gradient
-        image_hour = Clock.draw_gradient_image(
+        # Draw the hour and minute hand gradients
+        final_image = Clock.draw_conic_gradient(
             width, height, hour_angle, minute_angle, secondary_color, primary_color
         )
-        # Draw the minute hand gradient
-        image_minute = Clock.draw_gradient_image(
-            width, height, minute_angle, hour_angle, secondary_color, primary_color
-        )
-
-        # Combine the images using alpha blending
-        final_image = Image.alpha_composite(image_hour, image_minute)
 
         dim = min(width, height)
         minute_length = dim * 0.35
@@ -119,6 +186,28 @@ class Clock(BasePlugin):
         return final_image
 
     def draw_divided_clock(self, dimensions, time, primary_color=(32,183,174), secondary_color=(255,255,255)):
+        w,h = dimensions
+        # used to calculate percentages of sizes
+        dim = min(w,h)
+
+        # the face only depends on the resolution and colors, draw the hands on a copy
+        image = Clock.draw_divided_clock_face(tuple(dimensions), primary_color, secondary_color).copy()
+
+        hour_angle, minute_angle = Clock.calculate_clock_angles(time)
+        hand_width = max(int(dim * 0.009), 1)
+        Clock.draw_clock_hand(image, int(dim*0.3), minute_angle, secondary_color, hand_width=hand_width, border_color=secondary_color, round_corners=False)
+        Clock.draw_clock_hand(image, int(dim*0.2), hour_angle, secondary_color, hand_width=hand_width, border_color=secondary_color, round_corners=False)
+
+        Clock.drew_clock_center(image, max(int(dim*0.014), 1), primary_color, secondary_color, width=max(int(dim* 0.007), 1))
+
+        return image
+
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def draw_divided_clock_face(dimensions, primary_color, secondary_color):
+        """
+        Split background, face shadow, outline and hour marks of the divided clock.
+        """
         w,h = dimensions
         bg = Image.new("RGBA", dimensions, primary_color+(255,))
         bg_draw = ImageDraw.Draw(bg)
@@ -141,20 +230,37 @@ class Clock(BasePlugin):
         # clock outline
         image_draw.circle((w/2,h/2), face_size, fill=primary_color, outline=secondary_color, width=int(dim * 0.03125))
         
-        Clock.draw_hour_marks(image_draw._image, face_size - int(w*0.04375))
+        Clock.draw_hour_marks(canvas, face_size - int(w*0.04375))
 
-        hour_angle, minute_angle = Clock.calculate_clock_angles(time)
-        hand_width = max(int(dim * 0.009), 1)
-        Clock.draw_clock_hand(image_draw._image, int(dim*0.3), minute_angle, secondary_color, hand_width=hand_width, border_color=secondary_color, round_corners=False)
-        Clock.draw_clock_hand(image_draw._image, int(dim*0.2), hour_angle, secondary_color, hand_width=hand_width, border_color=secondary_color, round_corners=False)
+        return Image.alpha_composite(bg, canvas)
 
-        Clock.drew_clock_center(image_draw._image, max(int(dim*0.014), 1), primary_color, secondary_color, width=max(int(dim* 0.007), 1))
+    def draw_word_clock(self, dimensions, time, primary_color=(0,0,0), secondary_color=(255,255,255)):
+        w,h = dimensions
 
-        combined = Image.alpha_composite(bg, canvas)    
+        # the dimmed letter grid is shared, only the highlighted letters are drawn per render
+        bg = Clock.draw_word_clock_face(tuple(dimensions), primary_color, secondary_color)
 
+        canvas = Image.new("RGBA", bg.size, (0, 0, 0, 0))
+        image_draw = ImageDraw.Draw(canvas)
+
+        letter_positions = Clock.translate_word_grid_positions(time.hour % 12, time.minute)
+
+        fnt = get_font("napoli", min(w,h)*0.05)
+        for y, x in letter_positions:
+            x_pos, y_pos = Clock.word_grid_letter_position(dimensions, x, y)
+            letter = WORD_CLOCK_GRID[y][x]
+            image_draw.text((x_pos+2, y_pos+2), letter, anchor="mm", fill=secondary_color+(80,), font=fnt)
+            image_draw.text((x_pos, y_pos), letter, anchor="mm", fill=secondary_color+(255,), font=fnt)
+
+        combined = Image.alpha_composite(bg, canvas)
         return combined
 
-    def draw_word_clock(self, dimensions, time, primary_color=(0,0,0), secondary_color=(255,255,255)):
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def draw_word_clock_face(dimensions, primary_color, secondary_color):
+        """
+        Background and dimmed letter grid of the word clock.
+        """
         w,h = dimensions
 
         bg = Image.new("RGBA", dimensions, primary_color+(255,))
@@ -167,42 +273,27 @@ class Clock(BasePlugin):
         canvas = Image.new("RGBA", dimensions, (0, 0, 0, 0))
         image_draw = ImageDraw.Draw(canvas)
 
+        for y, row in enumerate(WORD_CLOCK_GRID):
+            for x, letter in enumerate(row):
+                x_pos, y_pos = Clock.word_grid_letter_position(dimensions, x, y)
+                image_draw.text((x_pos, y_pos), letter, anchor="mm", fill=secondary_color+(50,), font=fnt)
+
+        return Image.alpha_composite(bg, canvas)
+
+    @staticmethod
+    def word_grid_letter_position(dimensions, x, y):
+        w,h = dimensions
+
         border = [40, 40]
         if w > h:
             border[0] += (w-h)/2
         elif h > w:
             border[1] += (h-w)/2
 
-        letter_positions = Clock.translate_word_grid_positions(time.hour % 12, time.minute)
-
-        letter_grid = [
-            ['I','T','L','I','S','A','S','A','M','P','M'],
-            ['A','C','Q','U','A','R','T','E','R','D','C'],
-            ['T','W','E','N','T','Y','F','I','V','E','X'],
-            ['H','A','L','F','S','T','E','N','F','T','O'],
-            ['P','A','S','T','E','R','U','N','I','N','E'],
-            ['O','N','E','S','I','X','T','H','R','E','E'],
-            ['F','O','U','R','F','I','V','E','T','W','O'],
-            ['E','I','G','H','T','E','L','E','V','E','N'],
-            ['S','E','V','E','N','T','W','E','L','V','E'],
-            ['T','E','N','S','E','O','C','L','O','C','K'],
-        ]
-
         canvas_size = min(w,h) - min(border)*2
-        for y, row in enumerate(letter_grid):
-            for x, letter in enumerate(row):
-                x_pos = x*(canvas_size/(len(row)-1)) + border[0] 
-                y_pos = y*(canvas_size/(len(letter_grid)-1)) + border[1]
-
-                fill=secondary_color+(50,)
-                if [y,x] in letter_positions:
-                    fill=secondary_color+(255,)
-                    image_draw.text((x_pos+2, y_pos+2), letter, anchor="mm", fill=secondary_color+(80,), font=fnt)
-                
-                image_draw.text((x_pos, y_pos), letter, anchor="mm", fill=fill, font=fnt)
-
-        combined = Image.alpha_composite(bg, canvas)
-        return combined
+        x_pos = x*(canvas_size/(len(WORD_CLOCK_GRID[0])-1)) + border[0] 
+        y_pos = y*(canvas_size/(len(WORD_CLOCK_GRID)-1)) + border[1]
+        return x_pos, y_pos
 
     @staticmethod
     def format_time(hour, minute, zero_pad=False):
@@ -215,36 +306,71 @@ class Clock(BasePlugin):
         return f"{hour_str}:{minute_str}"
 
     @staticmethod
-    def draw_gradient_image(w, h, start_angle, end_angle, start_color, end_color):
+    def draw_conic_gradient(w, h, hour_angle, minute_angle, start_color, end_color):
         """
-        Draw a gradient that starts at start_angle and ends at end_angle, using RGBA colors.
-        Angles are interpreted for a clock face (0 at 12 o'clock, increasing clockwise).
+        Draw the hour and minute sweeps of the gradient clock in a single pass.
+
+        Both sweeps only depend on each pixel's angle from the center, so the composited
+        color is computed once per angle bin and then gathered through the cached angle field
+        straight into the RGBA buffer.
         """
-        x,y = np.ogrid[:h,:w]
-        cx,cy = h/2, w/2
+        hour_lut = Clock.gradient_lut(hour_angle, minute_angle, start_color, end_color)
+        minute_lut = Clock.gradient_lut(minute_angle, hour_angle, start_color, end_color)
+        lut = Clock.alpha_composite_lut(hour_lut, minute_lut)
+
+        gradient = np.empty((h, w, 4), dtype=np.uint8)
+        np.take(lut, Clock.get_angle_field(w, h), axis=0, out=gradient)
+        return Image.fromarray(gradient, mode="RGBA")
+
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def get_angle_field(w, h):
+        """
+        Angle bin of every pixel around the image center, computed once per resolution.
+        """
+        y, x = np.ogrid[:h, :w]
+        angles = np.arctan2((y - h/2).astype(np.float32), (x - w/2).astype(np.float32))
+        field = (np.floor(angles * (ANGLE_BINS / (2*np.pi))).astype(np.int32) % ANGLE_BINS).astype(np.uint16)
+        field.flags.writeable = False
+        return field
+
+    @staticmethod
+    def gradient_lut(start_angle, end_angle, start_color, end_color):
+        """
+        RGBA color for each angle bin of a gradient that starts at start_angle and ends at end_angle.
+        Angles are interpreted for a clock face (0 at 12 o'clock, increasing clockwise),
+        bins outside of the sweep are transparent.
+        """
+        bin_angles = (np.arange(ANGLE_BINS) + 0.5) * (2*np.pi / ANGLE_BINS)
 
         start_angle = -start_angle
         end_angle = -end_angle
 
-        theta = (np.arctan2(x-cx,y-cy) - start_angle)  % (2*np.pi)
+        theta = (bin_angles - start_angle) % (2*np.pi)
 
         angle_range = ((end_angle-start_angle) % (2 * np.pi))
         if angle_range == 0:
             angle_range = 2*np.pi  # Special case: full circle gradient
 
         anglemask = theta <= angle_range
-        theta = theta / angle_range  # Normalize to [0, 1] within range
+        theta = (theta / angle_range)[:, np.newaxis]  # Normalize to [0, 1] within range
 
         # Interpolate colors between start and end within the mask
-        gradient = np.zeros((h, w, 4), dtype=np.uint8)
-        for c in range(4):  # Iterate through RGBA channels
-            gradient[..., c] = (
-                start_color[c] * (1 - theta) + end_color[c] * (theta)
-            ).astype(np.uint8)
-        
-        # Fill with the specified solid color
-        gradient[~anglemask] = (0, 0, 0, 0)
-        return Image.fromarray(gradient, mode="RGBA")
+        lut = (np.array(start_color) * (1 - theta) + np.array(end_color) * theta).astype(np.uint8)
+        lut[~anglemask] = (0, 0, 0, 0)
+        return lut
+
+    @staticmethod
+    def alpha_composite_lut(dst, src):
+        """
+        Alpha composite two RGBA color tables, src over dst.
+        """
+        src_alpha = src[:, 3:] / 255
+        dst_alpha = dst[:, 3:] / 255 * (1 - src_alpha)
+        out_alpha = src_alpha + dst_alpha
+
+        rgb = (src[:, :3] * src_alpha + dst[:, :3] * dst_alpha) / np.where(out_alpha > 0, out_alpha, 1)
+        return np.concatenate([rgb, out_alpha * 255], axis=1).round().astype(np.uint8)
 
     @staticmethod
     def draw_clock_hand(image, length, angle, hand_color, hand_length=14, border_color=None, border_width = 0, hand_offset=0, round_corners=True, offset_width=4, hand_width=4):
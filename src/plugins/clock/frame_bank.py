@@ -0,0 +1,117 @@
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# bump when the file layout or the word clock drawing changes to rebuild existing banks
+BANK_VERSION = 1
+BANK_MAGIC = b"IPWB"
+# magic, version, number of frames, uncompressed frame size
+HEADER = struct.Struct("<4sHHI")
+# slot for every minute of a 12 hour clock
+STATE_COUNT = 12 * 60
+
+class WordClockFrameBank:
+    """
+    Packed panel frames for every distinct word clock state at one resolution and orientation.
+
+    The file holds a header, a table mapping each minute of a 12 hour clock to a frame slot,
+    the offsets of each slot and the zlib compressed frames. It is memory-mapped once built,
+    so a refresh only decompresses one frame.
+    """
+
+    def __init__(self, cache_dir, key):
+        self.file_path = os.path.join(cache_dir, f"word_clock_{key}.bin")
+        self.build_thread = None
+        self._mmap = None
+        self._states = None
+        self._offsets = None
+
+    @staticmethod
+    def get_key(resolution, orientation, primary_color, secondary_color, image_settings=()):
+        key = f"{BANK_VERSION}-{resolution[0]}x{resolution[1]}-{orientation}-{primary_color}-{secondary_color}-{','.join(sorted(image_settings))}"
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def is_ready(self):
+        return self._mmap is not None or self._load()
+
+    def get_frame(self, hour, minute):
+        if not self.is_ready():
+            return None
+        slot = self._states[(hour % 12) * 60 + minute]
+        return zlib.decompress(self._mmap[self._offsets[slot]:self._offsets[slot + 1]])
+
+    def build_async(self, render_state, get_positions):
+        """
+        Builds the bank on a background thread.
+
+        :param render_state: Function returning the packed frame for a datetime.
+        :param get_positions: Function returning the highlighted letters for an hour and minute.
+        """
+        if self.build_thread and self.build_thread.is_alive():
+            return
+        self.build_thread = threading.Thread(target=self._build, args=(render_state, get_positions), name="word-clock-bank", daemon=True)
+        self.build_thread.start()
+
+    def _build(self, render_state, get_positions):
+        logger.info(f"Building word clock frame bank {self.file_path}")
+        try:
+            slots = {}
+            states = []
+            frames = []
+            for hour in range(12):
+                for minute in range(60):
+                    positions = tuple(map(tuple, get_positions(hour, minute)))
+                    if positions not in slots:
+                        slots[positions] = len(frames)
+                        frame = render_state(datetime(2000, 1, 1, hour, minute))
+                        frames.append(zlib.compress(bytes(frame), 6))
+                    states.append(slots[positions])
+
+            offsets = [0]
+            for frame in frames:
+                offsets.append(offsets[-1] + len(frame))
+
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            tmp_path = self.file_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(HEADER.pack(BANK_MAGIC, BANK_VERSION, len(frames), len(zlib.decompress(frames[0]))))
+                f.write(struct.pack(f"<{STATE_COUNT}H", *states))
+                f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+                for frame in frames:
+                    f.write(frame)
+            os.replace(tmp_path, self.file_path)
+            logger.info(f"Built word clock frame bank with {len(frames)} frames, {offsets[-1] // 1024} KiB")
+        except Exception as e:
+            logger.exception(f"Failed to build word clock frame bank: {e}")
+
+    def _load(self):
+        if not os.path.isfile(self.file_path):
+            return False
+        try:
+            with open(self.file_path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version, frame_count, _ = HEADER.unpack_from(mapped, 0)
+            if magic != BANK_MAGIC or version != BANK_VERSION:
+                mapped.close()
+                return False
+
+            states = struct.unpack_from(f"<{STATE_COUNT}H", mapped, HEADER.size)
+            offsets_start = HEADER.size + STATE_COUNT * 2
+            offsets = struct.unpack_from(f"<{frame_count + 1}I", mapped, offsets_start)
+            data_start = offsets_start + (frame_count + 1) * 4
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Failed to load word clock frame bank {self.file_path}: {e}")
+            return False
+
+        self._states = states
+        self._offsets = [data_start + offset for offset in offsets]
+        self._mmap = mapped
+        return True
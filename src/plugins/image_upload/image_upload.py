@@ -1,13 +1,53 @@
 from plugins.base_plugin.base_plugin import BasePlugin
+from utils.upload_utils import get_frame, is_master, prerender_frames
+from utils.app_utils import resolve_path
+from plugins.image_upload.photo_library import get_photo_library
 from PIL import Image
 from io import BytesIO
+import os
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_LIBRARY_DIR = os.path.join("static", "images", "library")
+# seconds to wait for the first photos of a library that is being indexed
+INDEX_WAIT = 30
+
 class ImageUpload(BasePlugin):
+    def __init__(self, config, **dependencies):
+        super().__init__(config, **dependencies)
+        # image resolved by generate_frame, for the generate_image call of the same refresh
+        self.resolved = threading.local()
+
+    def generate_frame(self, settings, device_config):
+        # uploads are stored as masters named by content hash, their frames are cached
+        image_location = self.get_image_location(settings, device_config)
+        self.resolved.location = (settings, image_location)
+        if not self.render_frame or not image_location or not is_master(image_location) or not os.path.isfile(image_location):
+            return None
+
+        try:
+            frame = get_frame(image_location, device_config, self.render_frame,
+                              device_config.get_config("orientation"), self.config.get('image_settings', []))
+        except Exception as e:
+            logger.error(f"Failed to render image file: {str(e)}")
+            raise RuntimeError("Failed to read image file.")
+        self.resolved.location = None
+        return frame
+
+    def on_upload(self, file_path, device_config):
+        if self.render_frame:
+            prerender_frames(file_path, device_config, self.render_frame, self.config.get('image_settings', []))
+
     def generate_image(self, settings, device_config):
-        image_location = settings.get("imageFile")
+        # a refresh falling back from generate_frame shows the same photo instead of selecting the next one
+        resolved = getattr(self.resolved, "location", None)
+        self.resolved.location = None
+        if resolved and resolved[0] is settings:
+            image_location = resolved[1]
+        else:
+            image_location = self.get_image_location(settings, device_config)
 
         if not image_location:
             raise RuntimeError("Image not provided.")
@@ -18,4 +58,26 @@ class ImageUpload(BasePlugin):
             logger.error(f"Failed to read image file: {str(e)}")
             raise RuntimeError("Failed to read image file.")
 
-        return image
\ No newline at end of file
+        return image
+
+    def get_image_location(self, settings, device_config):
+        """
+        Returns the path of the image to show, the uploaded image or the next photo of the library.
+        """
+        if settings.get("mode") != "library":
+            return settings.get("imageFile")
+
+        library_dir = settings.get("libraryDir") or resolve_path(DEFAULT_LIBRARY_DIR)
+        if not os.path.isdir(library_dir):
+            raise RuntimeError(f"Photo library directory {library_dir} not found.")
+
+        library = get_photo_library(library_dir, device_config, self.render_frame, self.config.get('image_settings', []))
+        photo = library.next_photo(settings.get("selection", "shuffle"))
+        if not photo and library.index_thread and library.index_thread.is_alive():
+            # a new library is still being indexed, photos become available as they are added
+            library.index_thread.join(timeout=INDEX_WAIT)
+            photo = library.next_photo(settings.get("selection", "shuffle"))
+        if not photo:
+            raise RuntimeError("Photo library is empty or still being indexed.")
+        logger.info(f"Showing {photo['path']} from the photo library")
+        return photo["master_path"]
@@ -0,0 +1,263 @@
+import os
+import glob
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from PIL import Image
+from utils.upload_utils import ingest_image, get_frame, get_frame_path, FRAME_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_CACHE_DIR = "library"
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+THUMBNAIL_SIZE = (200, 200)
+# seconds between scans of the watched directory for new, changed or removed photos
+SCAN_INTERVAL = 15 * 60
+# EXIF DateTimeOriginal, in the Exif sub-IFD
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photos (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    aspect REAL NOT NULL,
+    captured_at TEXT,
+    last_shown REAL NOT NULL DEFAULT 0,
+    shuffle_key REAL NOT NULL,
+    thumbnail_path TEXT NOT NULL,
+    master_path TEXT NOT NULL,
+    frame_path TEXT
+);
+CREATE INDEX IF NOT EXISTS photos_last_shown ON photos (last_shown, id);
+CREATE INDEX IF NOT EXISTS photos_shuffle_key ON photos (shuffle_key);
+CREATE INDEX IF NOT EXISTS photos_hash ON photos (hash);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value
+);
+"""
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+def get_photo_library(library_dir, device_config, render_frame=None, image_settings=[]):
+    """
+    Returns the shared PhotoLibrary of the directory, building its index in the background.
+
+    :param render_frame: Packs images into panel frames, photos are pre-rendered while indexing if given.
+    """
+    library_dir = os.path.abspath(library_dir)
+    with _libraries_lock:
+        library = _libraries.get(library_dir)
+        if library is None:
+            library = _libraries[library_dir] = PhotoLibrary(library_dir, device_config)
+        library.render_frame = render_frame
+        library.image_settings = image_settings
+    library.start_indexing()
+    return library
+
+class PhotoLibrary:
+    """
+    SQLite index of the photos in a watched directory.
+
+    Each photo is stored with its content hash, dimensions, capture date, the time it
+    was last shown, a thumbnail, a panel sized master and its pre-rendered panel frame.
+    Selecting the next photo is an index lookup, so it doesn't depend on the size of
+    the library.
+    """
+
+    def __init__(self, library_dir, device_config, render_frame=None, image_settings=[]):
+        self.library_dir = library_dir
+        self.device_config = device_config
+        self.resolution = device_config.get_resolution()
+        self.render_frame = render_frame
+        self.image_settings = image_settings
+        cache_dir = os.path.join(device_config.cache_dir, LIBRARY_CACHE_DIR)
+        key = hashlib.sha1(library_dir.encode()).hexdigest()[:16]
+        self.db_path = os.path.join(cache_dir, f"{key}.sqlite3")
+        self.master_dir = os.path.join(cache_dir, "masters")
+        self.thumbnail_dir = os.path.join(cache_dir, "thumbnails")
+        self.index_thread = None
+        self.last_scan = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # connections are cheap and can't be shared between the refresh and indexing threads
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM photos").fetchone()[0]
+
+    def next_photo(self, selection="shuffle"):
+        """
+        Selects the next photo to show and records it as shown.
+
+        :param selection: "shuffle" goes through all photos in a random order before
+            repeating one, reshuffling for every round, "least_recent" picks the photo
+            that was shown longest ago.
+        :return: Dictionary of the photo's columns, or None if the library is empty.
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if selection == "least_recent":
+                photo = conn.execute("SELECT * FROM photos ORDER BY last_shown, id LIMIT 1").fetchone()
+            else:
+                cursor = conn.execute("SELECT value FROM state WHERE name = 'shuffle_cursor'").fetchone()
+                cursor = cursor[0] if cursor else -1
+                photo = conn.execute("SELECT * FROM photos WHERE shuffle_key > ? ORDER BY shuffle_key LIMIT 1", (cursor,)).fetchone()
+                if photo is None:
+                    # every photo was shown once, start over in a new order
+                    conn.executemany("UPDATE photos SET shuffle_key = ? WHERE id = ?",
+                                     [(random.random(), photo_id) for photo_id, in conn.execute("SELECT id FROM photos")])
+                    photo = conn.execute("SELECT * FROM photos ORDER BY shuffle_key LIMIT 1").fetchone()
+                if photo is not None:
+                    conn.execute("INSERT OR REPLACE INTO state (name, value) VALUES ('shuffle_cursor', ?)", (photo["shuffle_key"],))
+
+            if photo is None:
+                return None
+            conn.execute("UPDATE photos SET last_shown = ? WHERE id = ?", (time.time(), photo["id"]))
+            return dict(photo)
+
+    def start_indexing(self):
+        """Scans the watched directory on a background thread if it wasn't scanned recently."""
+        if self.index_thread and self.index_thread.is_alive():
+            return
+        if time.time() - self.last_scan < SCAN_INTERVAL:
+            return
+        self.index_thread = threading.Thread(target=self.scan, name="photo-library-index", daemon=True)
+        self.index_thread.start()
+
+    def scan(self):
+        """
+        Brings the index up to date with the watched directory.
+
+        Only photos that are new or whose size or modification time changed are
+        processed, each one is committed on its own so it can be shown right away.
+        The cached files of removed or replaced photos are deleted.
+        """
+        self.last_scan = time.time()
+        start = time.perf_counter()
+        with self._connect() as conn:
+            indexed = {path: (mtime, size, content_hash) for path, mtime, size, content_hash in conn.execute("SELECT path, mtime, size, hash FROM photos")}
+
+        found = set()
+        added = 0
+        # hashes that may no longer be used by any photo
+        stale_hashes = set()
+        for path, stat in self._find_photos():
+            found.add(path)
+            if indexed.get(path, ())[:2] == (stat.st_mtime, stat.st_size):
+                continue
+            try:
+                self._index_photo(path, stat)
+                added += 1
+                if path in indexed:
+                    stale_hashes.add(indexed[path][2])
+            except Exception as e:
+                logger.warning(f"Skipping photo {path}: {e}")
+
+        removed = [path for path in indexed if path not in found]
+        if removed:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM photos WHERE path = ?", [(path,) for path in removed])
+            stale_hashes.update(indexed[path][2] for path in removed)
+        self._remove_unused_files(stale_hashes)
+
+        logger.info(f"Indexed photo library {self.library_dir}: {added} added or updated, {len(removed)} removed "
+                    f"in {time.perf_counter() - start:.1f}s")
+
+    def _remove_unused_files(self, hashes):
+        """Deletes the master, thumbnail and frames of the hashes no photo in the index uses anymore."""
+        with self._connect() as conn:
+            unused = [content_hash for content_hash in hashes
+                      if not conn.execute("SELECT 1 FROM photos WHERE hash = ? LIMIT 1", (content_hash,)).fetchone()]
+
+        frame_dir = os.path.join(self.device_config.cache_dir, FRAME_CACHE_DIR)
+        for content_hash in unused:
+            file_paths = [os.path.join(self.master_dir, f"{content_hash}.png"), os.path.join(self.thumbnail_dir, f"{content_hash}.jpg")]
+            file_paths.extend(glob.glob(os.path.join(frame_dir, f"{glob.escape(content_hash)}-*.bin")))
+            for file_path in file_paths:
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+        if unused:
+            logger.info(f"Removed the cached files of {len(unused)} photos no longer in the library")
+
+    def _find_photos(self):
+        directories = [self.library_dir]
+        while directories:
+            try:
+                entries = list(os.scandir(directories.pop()))
+            except OSError as e:
+                logger.warning(f"Failed to read photo directory: {e}")
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in PHOTO_EXTENSIONS:
+                    yield entry.path, entry.stat()
+
+    def _index_photo(self, path, stat):
+        with open(path, "rb") as f:
+            content_hash, master_path = ingest_image(f, self.master_dir, self.resolution)
+
+        with Image.open(master_path) as master:
+            width, height = master.size
+            thumbnail_path = os.path.join(self.thumbnail_dir, f"{content_hash}.jpg")
+            if not os.path.isfile(thumbnail_path):
+                os.makedirs(self.thumbnail_dir, exist_ok=True)
+                thumbnail = master.convert("RGB")
+                thumbnail.thumbnail(THUMBNAIL_SIZE)
+                thumbnail.save(thumbnail_path, format="JPEG", quality=85)
+
+        # the frame of the current orientation is rendered ahead, so showing the photo only reads it
+        frame_path = None
+        if self.render_frame:
+            orientation = self.device_config.get_config("orientation")
+            get_frame(master_path, self.device_config, self.render_frame, orientation, self.image_settings)
+            frame_path = get_frame_path(self.device_config.cache_dir, master_path, self.resolution, orientation)
+
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT INTO photos (path, mtime, size, hash, width, height, aspect, captured_at, shuffle_key, thumbnail_path, master_path, frame_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, hash = excluded.hash,
+                    width = excluded.width, height = excluded.height, aspect = excluded.aspect, captured_at = excluded.captured_at,
+                    thumbnail_path = excluded.thumbnail_path, master_path = excluded.master_path, frame_path = excluded.frame_path""",
+                (path, stat.st_mtime, stat.st_size, content_hash, width, height, width / height,
+                 PhotoLibrary.get_capture_date(path, stat), random.random(), thumbnail_path, master_path, frame_path)
+            )
+
+    @staticmethod
+    def get_capture_date(path, stat):
+        """Capture date from the EXIF data, or the file's modification time, in ISO format."""
+        try:
+            with Image.open(path) as image:
+                value = image.getexif().get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL)
+            if value:
+                return datetime.strptime(value.strip("\x00 "), "%Y:%m:%d %H:%M:%S").isoformat()
+        except (OSError, ValueError, AttributeError):
+            pass
+        return datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")
@@ -1,54 +1,282 @@
 from plugins.base_plugin.base_plugin import BasePlugin
 from datetime import datetime, timedelta
-from utils.image_utils import get_image
+from concurrent.futures import ThreadPoolExecutor
+from utils.image_utils import get_image, resize_image
+from utils.metrics import record_cache_lookup
 from PIL import Image
+import os
+import time
 import logging
+import threading
+import requests
 from plugins.newspaper.constants import NEWSPAPERS
 
 logger = logging.getLogger(__name__)
 
 FREEDOM_FORUM_URL = "https://cdn.freedomforum.org/dfp/jpg{}/lg/{}.jpg"
+# seconds to wait when probing for and downloading a front page
+PROBE_TIMEOUT = 10
+DOWNLOAD_TIMEOUT = 30
+CACHE_DIR = "newspaper"
+# front pages of all newspapers are fetched once a day at this time
+DEFAULT_PREFETCH_TIME = "04:00"
+PREFETCH_WORKERS = 3
+PREFETCH_CHECK_INTERVAL = 10 * 60
+
 class Newspaper(BasePlugin):
+    def __init__(self, config, **dependencies):
+        super().__init__(config, **dependencies)
+        # position in the rotation of the current list of newspapers
+        self.rotation = {}
+        self.prefetch_thread = None
+        self.prefetch_lock = threading.Lock()
+        self.last_prefetch_date = None
+
     def generate_image(self, settings, device_config):
-        newspaper_slug = settings.get('newspaperSlug')
+        newspaper_slug = self.next_newspaper(settings)
+        return self.get_front_page(newspaper_slug, device_config)
+
+    def generate_frame(self, settings, device_config):
+        # front pages are cached as packed frames, so rotating through them needs no rendering
+        if not self.render_frame:
+            return None
+        self.schedule_prefetch(device_config)
+        return self.get_front_page(self.next_newspaper(settings), device_config, as_frame=True)
 
-        if not newspaper_slug:
+    @staticmethod
+    def get_newspaper_slugs(settings):
+        """Returns the slugs of the newspapers to rotate through, in order."""
+        newspaper_slugs = [settings.get('newspaperSlug') or ""] + (settings.get('newspaperSlugs') or "").split(",")
+        newspaper_slugs = list(dict.fromkeys(slug.strip().upper() for slug in newspaper_slugs if slug.strip()))
+        if not newspaper_slugs:
             raise RuntimeError("Newspaper input not provided.")
-        newspaper_slug = newspaper_slug.upper()
+        return newspaper_slugs
 
-        # Get today's date
-        today = datetime.today()
+    def next_newspaper(self, settings):
+        newspaper_slugs = Newspaper.get_newspaper_slugs(settings)
+        key = tuple(newspaper_slugs)
+        position = self.rotation.get(key, -1) + 1
+        self.rotation = {key: position % len(newspaper_slugs)}
+        return newspaper_slugs[position % len(newspaper_slugs)]
+
+    def get_front_page(self, newspaper_slug, device_config, as_frame=False):
+        """
+        Returns the newest front page of the newspaper, scaled to the panel.
 
+        Front pages are cached per slug, edition date and size. A cached front page from
+        today or later is used without going to the network, an older one only once no
+        newer edition is found.
+
+        :param as_frame: Return the packed panel frame instead of the image.
+        """
         # check the next day, then today, then prior day
+        today = datetime.today()
         days = [today + timedelta(days=diff) for diff in [1,0,-1,-2]]
 
-        image = None
-        for date in days:
-            image_url = FREEDOM_FORUM_URL.format(date.day, newspaper_slug)
-            image = get_image(image_url)
-            if image:
-                logging.info(f"Found {newspaper_slug} front cover for {date.strftime('%Y-%m-%d')}")
-                break
+        orientation = device_config.get_config("orientation")
+        dimensions = device_config.get_resolution()
+        if orientation == "vertical":
+            dimensions = dimensions[::-1]
+        cache_dir = os.path.join(device_config.cache_dir, CACHE_DIR)
+        extension = "bin" if as_frame else "png"
+
+        def cache_file(date, extension=extension):
+            return Newspaper.get_cache_file(cache_dir, newspaper_slug, date, dimensions, extension)
 
-        if image:
-            # expand height if newspaper is wider than resolution
-            img_width, img_height = image.size
-            desired_width, desired_height = device_config.get_resolution()
+        cached_date = next((date for date in days if os.path.isfile(cache_file(date))), None)
+        record_cache_lookup("newspaper", bool(cached_date and cached_date.date() >= today.date()))
+        if not (cached_date and cached_date.date() >= today.date()):
+            newer_days = days[:days.index(cached_date)] if cached_date else days
+            date = Newspaper.find_front_page(newspaper_slug, newer_days)
+            if date is not None:
+                logging.info(f"Found {newspaper_slug} front cover for {date.strftime('%Y-%m-%d')}")
+                return self.cache_front_page(newspaper_slug, date, orientation, dimensions, cache_file, as_frame)
+            if not cached_date:
+                raise RuntimeError("Newspaper front cover not found.")
 
-            img_ratio = img_width / img_height
-            desired_ratio = desired_width / desired_height
+        logger.info(f"Using cached {newspaper_slug} front cover for {cached_date.strftime('%Y-%m-%d')}")
+        if as_frame:
+            with open(cache_file(cached_date), "rb") as f:
+                return f.read()
+        return Image.open(cache_file(cached_date))
 
-            if img_ratio < desired_ratio:
-                new_height =  int((img_width*desired_width) / desired_height)
-                new_image = Image.new("RGB", (img_width, new_height), (255, 255, 255))
-                new_image.paste(image, (0, 0))
-                image = new_image
+    def cache_front_page(self, newspaper_slug, date, orientation, dimensions, cache_file, as_frame):
+        if os.path.isfile(cache_file(date, "png")):
+            image = Image.open(cache_file(date, "png"))
         else:
-            raise RuntimeError("Newspaper front cover not found.")
-    
-        return image
-    
+            image = get_image(FREEDOM_FORUM_URL.format(date.day, newspaper_slug), timeout=DOWNLOAD_TIMEOUT)
+            if not image:
+                raise RuntimeError("Newspaper front cover not found.")
+            image = Newspaper.scale_front_page(image, dimensions)
+            Newspaper.save_to_cache(cache_file(date, "png"), lambda f: image.save(f, format="PNG"))
+
+        if not as_frame:
+            return image
+        frame = self.render_frame(image, self.config.get('image_settings', []), orientation)
+        Newspaper.save_to_cache(cache_file(date, "bin"), lambda f: f.write(frame))
+        return frame
+
+    def schedule_prefetch(self, device_config):
+        """
+        Prefetches the front pages of all newspapers once a day at the prefetch time.
+
+        The prefetch follows the settings of the scheduled newspaper plugin and stops
+        once newspaper is no longer the scheduled plugin.
+        """
+        with self.prefetch_lock:
+            if not self.prefetch_thread:
+                self.prefetch_thread = threading.Thread(target=self._run_prefetch, args=(device_config,),
+                                                        name="newspaper-prefetch", daemon=True)
+                self.prefetch_thread.start()
+
+    @staticmethod
+    def get_scheduled_settings(device_config):
+        """
+        :return: The settings of the scheduled plugin if it is newspaper, otherwise None.
+        """
+        plugin_settings = device_config.get_config("refresh_settings", default={}).get("plugin_settings") or {}
+        return plugin_settings if plugin_settings.get("plugin_id") == "newspaper" else None
+
+    def _run_prefetch(self, device_config):
+        # when started after today's prefetch time, the first prefetch is tomorrow
+        started = datetime.now()
+        while True:
+            with self.prefetch_lock:
+                settings = Newspaper.get_scheduled_settings(device_config)
+                try:
+                    newspaper_slugs = Newspaper.get_newspaper_slugs(settings) if settings else None
+                except RuntimeError:
+                    newspaper_slugs = None
+                if not newspaper_slugs:
+                    logger.info("Newspaper is no longer scheduled, stopping the prefetch")
+                    self.prefetch_thread = None
+                    return
+
+            prefetch_time = settings.get('prefetchTime') or DEFAULT_PREFETCH_TIME
+            now = datetime.now()
+            try:
+                hour, minute = map(int, prefetch_time.split(":"))
+            except ValueError:
+                hour, minute = map(int, DEFAULT_PREFETCH_TIME.split(":"))
+            prefetch_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if self.last_prefetch_date is None and started >= prefetch_at:
+                self.last_prefetch_date = now.date()
+
+            if now >= prefetch_at and self.last_prefetch_date != now.date():
+                self.last_prefetch_date = now.date()
+                self.prefetch(newspaper_slugs, device_config)
+                continue
+
+            if now >= prefetch_at:
+                prefetch_at += timedelta(days=1)
+            # wake up regularly, the schedule and the prefetch time may change with the settings
+            time.sleep(min((prefetch_at - now).total_seconds(), PREFETCH_CHECK_INTERVAL))
+
+    def prefetch(self, newspaper_slugs, device_config):
+        """Caches the frames of the newspapers in a bounded parallel batch."""
+        logger.info(f"Prefetching front covers of {', '.join(newspaper_slugs)}")
+        start = time.perf_counter()
+
+        def fetch(newspaper_slug):
+            try:
+                self.get_front_page(newspaper_slug, device_config, as_frame=True)
+            except Exception as e:
+                logger.error(f"Failed to prefetch {newspaper_slug} front cover: {e}")
+
+        with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="newspaper-prefetch") as executor:
+            list(executor.map(fetch, newspaper_slugs))
+        logger.info(f"Prefetched {len(newspaper_slugs)} front covers in {time.perf_counter() - start:.1f}s")
+
+    @staticmethod
+    def find_front_page(newspaper_slug, days):
+        """
+        Probes the front page urls of the days concurrently.
+
+        :return: The first of the days with a front page, or None.
+        """
+        urls = [FREEDOM_FORUM_URL.format(date.day, newspaper_slug) for date in days]
+        if not urls:
+            return None
+
+        executor = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="newspaper-probe")
+        try:
+            futures = [executor.submit(Newspaper.probe, url) for url in urls]
+            # days are in order of preference, so the first hit in that order wins
+            for date, future in zip(days, futures):
+                if future.result():
+                    return date
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return None
+
+    @staticmethod
+    def probe(url):
+        """Checks whether an image exists at the url without downloading it."""
+        try:
+            response = requests.head(url, timeout=PROBE_TIMEOUT, allow_redirects=True)
+            if response.status_code == 405:
+                # servers without HEAD support, only the headers are read
+                with requests.get(url, timeout=PROBE_TIMEOUT, stream=True) as response:
+                    pass
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to probe {url}: {e}")
+            return False
+        return 200 <= response.status_code < 300 and response.headers.get("Content-Type", "image").startswith("image")
+
+    @staticmethod
+    def scale_front_page(image, dimensions):
+        """
+        Scales the front page to the panel, keeping its full width and the top of the page.
+        """
+        desired_width, desired_height = dimensions
+        img_width, img_height = image.size
+
+        # decode the jpeg at a reduced scale when it is much larger than the panel
+        image.draft("RGB", (desired_width, int(img_height * desired_width / img_width)))
+        image = image.convert("RGB")
+        img_width, img_height = image.size
+
+        # expand height if newspaper is wider than resolution
+        img_ratio = img_width / img_height
+        desired_ratio = desired_width / desired_height
+
+        if img_ratio < desired_ratio:
+            new_height =  int((img_width*desired_width) / desired_height)
+            new_image = Image.new("RGB", (img_width, new_height), (255, 255, 255))
+            new_image.paste(image, (0, 0))
+            image = new_image
+
+        return resize_image(image, dimensions, ["keep-width"])
+
+    @staticmethod
+    def get_cache_file(cache_dir, newspaper_slug, date, dimensions, extension="png"):
+        return os.path.join(cache_dir, f"{newspaper_slug}-{date.strftime('%Y%m%d')}-{dimensions[0]}x{dimensions[1]}.{extension}")
+
+    @staticmethod
+    def save_to_cache(file_path, write):
+        """
+        Atomically writes a cache file and removes cached front pages older than a few days.
+
+        :param write: Function writing the content to the open file.
+        """
+        cache_dir = os.path.dirname(file_path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # only the front pages of the last few days can be shown
+            oldest = (datetime.today() - timedelta(days=3)).strftime('%Y%m%d')
+            for file_name in os.listdir(cache_dir):
+                parts = file_name.rsplit("-", 2)
+                if len(parts) == 3 and parts[1] < oldest:
+                    os.remove(os.path.join(cache_dir, file_name))
+
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            logger.error(f"Failed to cache front page {file_path}: {e}")
+
     def generate_settings_template(self):
         template_params = super().generate_settings_template()
         template_params['newspapers'] = sorted(NEWSPAPERS, key=lambda n: n['name'])
-        return template_params
\ No newline at end of file
+        return template_params
@@ -1,52 +1,130 @@
-# app_registry.py
-
 import os
+import time
 import importlib
 import logging
-from utils.app_utils import resolve_path
+import threading
+from utils.app_utils import resolve_path, get_rss_bytes
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 PLUGINS_DIR = 'plugins'
+
+# plugin instances, created the first time a plugin is used
 PLUGIN_CLASSES = {}
+# plugins.json entries for every registered plugin, keyed by id
+PLUGIN_CONFIGS = {}
+# import time and memory cost for every plugin that has been loaded
+PLUGIN_LOAD_STATS = {}
 
-def load_plugins(plugins_config):
-    plugins_module_path = Path(resolve_path(PLUGINS_DIR))
+_dependencies = {}
+_load_lock = threading.RLock()
+
+def load_plugins(plugins_config, **dependencies):
+    """Register plugins from their plugins.json metadata, modules are imported on first use."""
+    _dependencies.update(dependencies)
     for plugin in plugins_config:
-        plugin_id = plugin.get('id')
-        if plugin.get("disabled", False):
-            logging.info(f"Plugin {plugin_id} is disabled, skipping.")
-            continue
+        register_plugin(plugin)
+
+def register_plugin(plugin):
+    plugin_id = plugin.get('id')
+    if plugin.get("disabled", False):
+        logging.info(f"Plugin {plugin_id} is disabled, skipping.")
+        unregister_plugin(plugin_id)
+        return False
+
+    plugin_dir = Path(resolve_path(PLUGINS_DIR)) / plugin_id
+    if not plugin_dir.is_dir():
+        logging.error(f"Could not find plugin directory {plugin_dir} for '{plugin_id}', skipping.")
+        return False
+
+    module_path = plugin_dir / f"{plugin_id}.py"
+    if not module_path.is_file():
+        logging.error(f"Could not find module path {module_path} for '{plugin_id}', skipping.")
+        return False
+
+    with _load_lock:
+        # drop a loaded instance if plugins.json changed its entry
+        if plugin_id in PLUGIN_CONFIGS and PLUGIN_CONFIGS[plugin_id] != plugin:
+            PLUGIN_CLASSES.pop(plugin_id, None)
+        PLUGIN_CONFIGS[plugin_id] = plugin
+    return True
 
-        plugin_dir = plugins_module_path / plugin_id
-        if not plugin_dir.is_dir():
-            logging.error(f"Could not find plugin directory {plugin_dir} for '{plugin_id}', skipping.")
-            continue
+def unregister_plugin(plugin_id):
+    with _load_lock:
+        PLUGIN_CONFIGS.pop(plugin_id, None)
+        PLUGIN_CLASSES.pop(plugin_id, None)
 
-        module_path = plugin_dir / f"{plugin_id}.py"
-        if not module_path.is_file():
-            logging.error(f"Could not find module path {module_path} for '{plugin_id}', skipping.")
-            continue
+def _import_plugin(plugin_id):
+    plugin = PLUGIN_CONFIGS[plugin_id]
+    module_name = f"plugins.{plugin_id}.{plugin_id}"
 
-        module_name = f"plugins.{plugin_id}.{plugin_id}"
-        try:
-            module = importlib.import_module(module_name)
-            plugin_class = getattr(module, plugin.get("class"), None)
+    rss_before = get_rss_bytes()
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        logging.error(f"Failed to import plugin module {module_name}: {e}")
+        return None
 
-            if plugin_class:
-                # Create an instance of the plugin class and add it to the plugin_classes dictionary
-                PLUGIN_CLASSES[plugin_id] = plugin_class(plugin)
+    plugin_class = getattr(module, plugin.get("class"), None)
+    if not plugin_class:
+        logging.error(f"Plugin module {module_name} has no class '{plugin.get('class')}'")
+        return None
 
-        except ImportError as e:
-            logging.error(f"Failed to import plugin module {module_name}: {e}")
+    # Create an instance of the plugin class and add it to the plugin_classes dictionary
+    instance = plugin_class(plugin, **_dependencies)
+    PLUGIN_CLASSES[plugin_id] = instance
+
+    # shared dependencies (e.g. numpy) are attributed to the first plugin that imports them
+    import_seconds = time.perf_counter() - start
+    rss_after = get_rss_bytes()
+    rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    PLUGIN_LOAD_STATS[plugin_id] = {
+        "import_seconds": round(import_seconds, 4),
+        "rss_delta_bytes": rss_delta,
+        "loaded_at": time.time()
+    }
+    rss_str = f"{rss_delta / (1024 * 1024):.1f} MiB" if rss_delta is not None else "unknown"
+    logger.info(f"Loaded plugin {plugin_id} in {import_seconds * 1000:.0f} ms, rss: {rss_str}")
+    return instance
 
 def get_plugin_instance(plugin_config):
     plugin_id = plugin_config.get("id")
-    # Retrieve the plugin class factory function
-    plugin_class = PLUGIN_CLASSES.get(plugin_id)
-    
-    if plugin_class:
-        # Initialize the plugin with its configuration
-        return plugin_class
+    plugin_instance = PLUGIN_CLASSES.get(plugin_id)
+    # config snapshots are reused until plugins.json is reloaded, so an unchanged entry is the same object
+    if plugin_instance and PLUGIN_CONFIGS.get(plugin_id) is plugin_config:
+        return plugin_instance
+
+    with _load_lock:
+        # plugins added to or changed in plugins.json after startup are (re-)registered on use
+        if PLUGIN_CONFIGS.get(plugin_id) != plugin_config:
+            register_plugin(plugin_config)
+        elif PLUGIN_CONFIGS.get(plugin_id) is not plugin_config:
+            PLUGIN_CONFIGS[plugin_id] = plugin_config
+        plugin_instance = None
+        if plugin_id in PLUGIN_CONFIGS:
+            plugin_instance = PLUGIN_CLASSES.get(plugin_id) or _import_plugin(plugin_id)
+
+    if plugin_instance:
+        return plugin_instance
     else:
-        raise ValueError(f"Plugin '{plugin_id}' is not registered.")
\ No newline at end of file
+        raise ValueError(f"Plugin '{plugin_id}' is not registered.")
+
+def warm_up_plugins(plugin_ids=None):
+    """Import registered plugins on a background thread so their first use is fast."""
+    def _warm_up():
+        for plugin_id in plugin_ids or list(PLUGIN_CONFIGS):
+            plugin = PLUGIN_CONFIGS.get(plugin_id)
+            if not plugin:
+                continue
+            try:
+                get_plugin_instance(plugin)
+            except Exception as e:
+                logger.error(f"Failed to warm up plugin {plugin_id}: {e}")
+
+    thread = threading.Thread(target=_warm_up, name="plugin-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def get_plugin_load_stats():
+    return {plugin_id: dict(stats) for plugin_id, stats in PLUGIN_LOAD_STATS.items()}
@@ -0,0 +1,203 @@
+import os
+import io
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = "profiles"
+INDEX_FILE = "index.json"
+DEFAULT_RETENTION = 5
+# frames kept per allocation traceback, deeper stacks cost more memory while tracing
+TRACEMALLOC_FRAMES = 10
+TOP_ENTRIES = 40
+ARTIFACTS = {
+    "pstats": ("pstats", "application/octet-stream"),
+    "stats": ("stats.txt", "text/plain"),
+    "allocations": ("allocations.txt", "text/plain")
+}
+
+class RefreshProfiler:
+    def __init__(self, device_config):
+        """
+        Captures a cProfile and tracemalloc profile of a single display refresh when armed.
+
+        A capture is stored as a pstats file, a text summary of the slowest functions and
+        the top allocation sites, the oldest captures beyond the retention count are removed.
+        While not armed, a refresh only checks the armed flag.
+
+        :param device_config: The device configuration (Config class).
+        """
+        self.device_config = device_config
+        self.profile_dir = os.path.join(device_config.cache_dir, PROFILE_DIR)
+        self.lock = threading.Lock()
+        self.armed = False
+        self.armed_plugin_id = None
+        self.entries = self._load_index()
+        self.next_id = max((entry["id"] for entry in self.entries), default=0) + 1
+
+    def arm(self, plugin_id=None):
+        """
+        Profiles the next refresh, or the next refresh of the plugin if given.
+        """
+        with self.lock:
+            self.armed = True
+            self.armed_plugin_id = plugin_id or None
+        logger.info(f"Profiling armed for the next refresh{f' of {plugin_id}' if plugin_id else ''}")
+
+    def disarm(self):
+        with self.lock:
+            self.armed = False
+            self.armed_plugin_id = None
+
+    def get_state(self):
+        with self.lock:
+            return {"armed": self.armed, "plugin_id": self.armed_plugin_id}
+
+    def is_armed_for(self, plugin_id):
+        # read without the lock, this is the only cost of a refresh while not armed
+        return self.armed and self.armed_plugin_id in (None, plugin_id)
+
+    def run(self, plugin_id, function, *args, **kwargs):
+        """
+        Calls the function under the profilers if still armed for the plugin, and stores the capture.
+
+        Allocations are traced for the whole process while the function runs, so
+        background threads allocating at the same time show up as well.
+
+        :return: The function's return value, exceptions are raised after the capture is stored.
+        """
+        with self.lock:
+            if not (self.armed and self.armed_plugin_id in (None, plugin_id)):
+                return function(*args, **kwargs)
+            self.armed = False
+            self.armed_plugin_id = None
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        else:
+            tracemalloc.reset_peak()
+
+        profile = cProfile.Profile()
+        error = None
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                entry_id = self._save(profile, snapshot, {
+                    "plugin_id": plugin_id,
+                    "started_at": started_at,
+                    "duration": round(duration, 3),
+                    "peak_memory": peak,
+                    "error": error
+                })
+                logger.info(f"Stored profile {entry_id} of {plugin_id}: {duration:.2f}s, peak traced memory {peak // 1024} KiB")
+            except Exception as e:
+                logger.exception(f"Failed to store profile of {plugin_id}: {e}")
+
+    def get_entries(self):
+        """Returns the metadata of the stored captures, newest first."""
+        with self.lock:
+            return [dict(entry) for entry in reversed(self.entries)]
+
+    def get_artifact_path(self, entry_id, artifact):
+        """
+        Returns the path of a stored capture's artifact, or None if it doesn't exist.
+
+        :param artifact: One of ARTIFACTS.
+        """
+        with self.lock:
+            if artifact not in ARTIFACTS or not any(entry["id"] == entry_id for entry in self.entries):
+                return None
+        file_path = self._get_path(entry_id, ARTIFACTS[artifact][0])
+        return file_path if os.path.isfile(file_path) else None
+
+    def _save(self, profile, snapshot, metadata):
+        retention = max(int(self.device_config.get_config("profile_retention", default=DEFAULT_RETENTION)), 1)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+
+        try:
+            self._write_artifacts(entry_id, profile, snapshot, metadata)
+        except Exception:
+            # files of a capture that isn't in the index would never be removed
+            self._remove_artifacts(entry_id)
+            raise
+
+        with self.lock:
+            self.entries.append(dict(metadata, id=entry_id))
+            # drop the oldest captures beyond the retention count
+            removed = self.entries[:-retention]
+            self.entries = self.entries[-retention:]
+            self._write_file(os.path.join(self.profile_dir, INDEX_FILE), json.dumps(self.entries, indent=2))
+
+        for entry in removed:
+            self._remove_artifacts(entry["id"])
+        return entry_id
+
+    def _write_artifacts(self, entry_id, profile, snapshot, metadata):
+        profile.dump_stats(self._get_path(entry_id, "pstats"))
+
+        output = io.StringIO()
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_ENTRIES)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_ENTRIES)
+        self._write_file(self._get_path(entry_id, "stats.txt"), output.getvalue())
+
+        # leave out the profilers' own allocations
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__)
+        ])
+        lines = [f"Top {TOP_ENTRIES} allocation sites by size, peak traced memory: {metadata['peak_memory'] // 1024} KiB", ""]
+        for index, stat in enumerate(snapshot.statistics("traceback")[:TOP_ENTRIES], 1):
+            lines.append(f"#{index}: {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+            lines.extend(f"    {line}" for line in stat.traceback.format(most_recent_first=True))
+        self._write_file(self._get_path(entry_id, "allocations.txt"), "\n".join(lines) + "\n")
+
+    def _remove_artifacts(self, entry_id):
+        for file_name, _ in ARTIFACTS.values():
+            for file_path in (self._get_path(entry_id, file_name), self._get_path(entry_id, file_name) + ".tmp"):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+
+    def _get_path(self, entry_id, file_name):
+        return os.path.join(self.profile_dir, f"{int(entry_id)}.{file_name}")
+
+    def _load_index(self):
+        index_file = os.path.join(self.profile_dir, INDEX_FILE)
+        if not os.path.isfile(index_file):
+            return []
+        try:
+            with open(index_file) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read profile index {index_file}: {e}")
+            return []
+
+    @staticmethod
+    def _write_file(file_path, text):
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, file_path)
@@ -1,9 +1,14 @@
+import math
 import threading
 import time
 import logging
+from utils.metrics import histogram, counter
 
 logger = logging.getLogger(__name__)
 
+REFRESH_SECONDS = histogram("inkypi_refresh_seconds", "Duration of display refreshes by plugin and trigger.", labels=("plugin_id", "trigger"))
+REFRESH_CHECKS = counter("inkypi_refresh_checks_total", "Refresh checks by trigger and result (displayed, skipped or failed).", labels=("trigger", "result"))
+
 class RefreshTask:
     def __init__(self, device_config, display_manager):
         self.device_config = device_config
@@ -12,6 +17,7 @@ class RefreshTask:
         self.lock = threading.Lock()
         self.condition = threading.Condition(self.lock)
         self.time_until_refresh = 0
+        self.last_check = time.monotonic()
         self.running = False
         self.manual_update_settings = {}
 
@@ -36,16 +42,18 @@ class RefreshTask:
 
     def _run(self):
         while True:
+            trigger = "interval"
             try:
                 with self.condition:
                     sleep_time = self.device_config.get_config("scheduler_sleep_time")
 
                     # Wait for sleep_time or until notified
                     self.condition.wait(timeout=sleep_time)
+                    self.last_check = time.monotonic()
                     self.refresh_result = {}
                     self.refresh_event.clear()
 
-                    refresh_settings = self.device_config.get_config("refresh_settings")
+                    refresh_settings = self.device_config.get_config("refresh_settings", default={})
 
                     # Exit if `stop()` is called
                     if not self.running:
@@ -56,6 +64,7 @@ class RefreshTask:
                         logger.info("Manual update requested")
                         update_settings = self.manual_update_settings
                         update_display = True
+                        trigger = "manual"
                         self.manual_update_settings = {}
                     else:
                         logger.info(f"Running interval refresh check.")
@@ -69,16 +78,31 @@ class RefreshTask:
 
                     if update_display and update_settings:
                         logger.info("Refreshing display...")
-                        self.display_manager.display_plugin(update_settings)
+                        with REFRESH_SECONDS.time(plugin_id=update_settings.get("plugin_id"), trigger=trigger):
+                            self.display_manager.display_plugin(update_settings)
+                        REFRESH_CHECKS.inc(trigger=trigger, result="displayed")
                     else:
                         logger.info(f"Next refresh in {self.time_until_refresh} seconds.")
+                        REFRESH_CHECKS.inc(trigger=trigger, result="skipped")
 
             except Exception as e:
                 logger.error(f"Exception during refresh: {e}")
+                REFRESH_CHECKS.inc(trigger=trigger, result="failed")
                 self.refresh_result["exception"] = e  # Capture exception
             finally:
                 self.refresh_event.set()
 
+    def get_seconds_until_refresh(self):
+        """
+        Estimates the seconds until the next scheduled refresh starts.
+
+        Refreshes start at the interval check on which time_until_refresh runs out,
+        manual updates can still come at any time.
+        """
+        sleep_time = self.device_config.get_config("scheduler_sleep_time")
+        checks = max(math.ceil(self.time_until_refresh / sleep_time), 1)
+        return self.last_check + checks * sleep_time - time.monotonic()
+
     def manual_update(self, settings):
         if self.running:
             with self.condition:
@@ -0,0 +1,93 @@
+import os
+import time
+import socket
+import hashlib
+import logging
+import threading
+from utils.app_utils import generate_startup_image
+from utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+STARTUP_FRAME_DIR = "startup"
+# bump when generate_startup_image or the frame packing changes to render the cached frame again
+STARTUP_FRAME_VERSION = 2
+
+class StartupOrchestrator:
+    def __init__(self, device_config, display_manager, start_time=None):
+        """
+        Brings up the panel in the background so the web server can answer immediately.
+
+        :param device_config: The device configuration (Config class).
+        :param display_manager: The DisplayManager driving the panel.
+        :param start_time: time.monotonic() value taken when the process started.
+        """
+        self.device_config = device_config
+        self.display_manager = display_manager
+        self.start_time = start_time or time.monotonic()
+        self.first_response_time = None
+        self.panel_ready_time = None
+        self.thread = None
+
+    def start(self):
+        if not self.thread or not self.thread.is_alive():
+            logger.info("Starting panel initialization in the background")
+            self.thread = threading.Thread(target=self._run, name="startup", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        try:
+            self.display_manager.initialize()
+            self.panel_ready_time = time.monotonic()
+            logger.info(f"Panel initialized {self.panel_ready_time - self.start_time:.2f}s after start")
+
+            # display default inkypi image on startup
+            if self.device_config.get_config("startup") is True:
+                logger.info("Startup flag is set, displaying startup image")
+                frame = self.get_startup_frame()
+                self.display_manager.display_frame(frame, sleep=True)
+                self.display_manager.history.record(frame, {"plugin_id": None, "orientation": None})
+                self.device_config.update_value("startup", False)
+                logger.info(f"Startup image displayed {self.display_manager.first_frame_time - self.start_time:.2f}s after start")
+        except Exception as e:
+            logger.exception(f"Failed to bring up the display: {e}")
+
+    def get_startup_frame(self):
+        """
+        Returns the packed startup frame, rendering and caching it on first use.
+        """
+        resolution = self.device_config.get_resolution()
+        hostname = socket.gethostname()
+        key = hashlib.sha1(f"{STARTUP_FRAME_VERSION}-{hostname}-{resolution[0]}x{resolution[1]}".encode()).hexdigest()[:16]
+
+        frame_dir = os.path.join(self.device_config.cache_dir, STARTUP_FRAME_DIR)
+        frame_path = os.path.join(frame_dir, f"{key}.bin")
+        record_cache_lookup("startup_frame", os.path.isfile(frame_path))
+        if os.path.isfile(frame_path):
+            with open(frame_path, "rb") as f:
+                return f.read()
+
+        image = generate_startup_image(resolution)
+        frame = self.display_manager.render_frame(image)
+
+        os.makedirs(frame_dir, exist_ok=True)
+        tmp_path = frame_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(frame)
+        os.replace(tmp_path, frame_path)
+        return frame
+
+    def record_response(self):
+        if self.first_response_time is None:
+            self.first_response_time = time.monotonic()
+            logger.info(f"First web response sent {self.first_response_time - self.start_time:.2f}s after start")
+
+    def get_timings(self):
+        def since_start(timestamp):
+            return round(timestamp - self.start_time, 3) if timestamp is not None else None
+
+        return {
+            "time_to_first_response": since_start(self.first_response_time),
+            "time_to_panel_ready": since_start(self.panel_ready_time),
+            "time_to_first_frame": since_start(self.display_manager.first_frame_time)
+        }
@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import logging
+import threading
+import httpx
+import requests
+from openai import OpenAI, DefaultHttpxClient
+
+logger = logging.getLogger(__name__)
+
+# image generation regularly takes 10-40 seconds
+DEFAULT_TIMEOUT = 120
+CONNECT_TIMEOUT = 10
+DEFAULT_MAX_RETRIES = 2
+# idle connections are kept open between refreshes of the AI plugins
+MAX_KEEPALIVE_CONNECTIONS = 4
+KEEPALIVE_EXPIRY = 300
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_openai_client(api_key, timeout=None, max_retries=None):
+    """
+    Returns the shared OpenAI client for the API key, built on first use.
+
+    Clients keep their connection pool between calls, so later requests reuse open
+    TLS connections instead of connecting again.
+
+    :param timeout: Read timeout in seconds, DEFAULT_TIMEOUT if not set.
+    :param max_retries: Retries of failed or rate limited requests, DEFAULT_MAX_RETRIES if not set.
+    """
+    # settings left empty in the config fall back to the defaults as well
+    timeout = DEFAULT_TIMEOUT if timeout in (None, "") else float(timeout)
+    max_retries = DEFAULT_MAX_RETRIES if max_retries in (None, "") else int(max_retries)
+    # key by a hash so the api key isn't kept around in another place
+    key = (hashlib.sha256(api_key.encode()).hexdigest(), timeout, max_retries)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            logger.info(f"Creating OpenAI client, timeout: {timeout}s, max retries: {max_retries}")
+            http_client = DefaultHttpxClient(
+                limits=httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=KEEPALIVE_EXPIRY)
+            )
+            client = OpenAI(
+                api_key=api_key,
+                timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+                max_retries=max_retries,
+                http_client=http_client
+            )
+            _clients[key] = client
+        return client
+
+def get_client_for_device(api_key, device_config):
+    """Returns the shared OpenAI client using the timeout and retries of the device config."""
+    return get_openai_client(
+        api_key,
+        timeout=device_config.get_config("openai_timeout", default=DEFAULT_TIMEOUT),
+        max_retries=device_config.get_config("openai_max_retries", default=DEFAULT_MAX_RETRIES)
+    )
+
+def decode_image_data(image_data):
+    """Returns the bytes of an image returned by the images API, from b64_json or its url."""
+    if image_data.b64_json:
+        return base64.b64decode(image_data.b64_json)
+
+    response = requests.get(image_data.url, timeout=(CONNECT_TIMEOUT, DEFAULT_TIMEOUT))
+    response.raise_for_status()
+    return response.content
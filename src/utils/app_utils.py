@@ -3,17 +3,11 @@ import os
 import socket
 
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+from utils.text_utils import get_font, fit_font_size
 
 logger = logging.getLogger(__name__)
 
-FONTS = {
-    "ds-gigi": "DS-DIGI.TTF",
-    "napoli": "Napoli.ttf",
-    "jost": "Jost.ttf",
-    "jost-semibold": "Jost-SemiBold.ttf"
-}
-
 def resolve_path(file_path):
     src_path = Path(os.getenv("SRC_DIR"))
 
@@ -41,13 +35,14 @@ def is_connected():
     except OSError:
         return False
 
-def get_font(font_name, font_size=50):
-    if font_name in FONTS:
-        font_path = resolve_path(os.path.join("static", "fonts", FONTS[font_name]))
-        return ImageFont.truetype(font_path, font_size)
-    else:
-        logger.warn(f"Requested font not found: font_name: {font_name}")
-    return None
+def get_rss_bytes():
+    """Return the resident set size of the current process in bytes, or None if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
 
 def generate_startup_image(dimensions=(800,480)):
     bg_color = (255,255,255)
@@ -55,7 +50,6 @@ def generate_startup_image(dimensions=(800,480)):
     width,height = dimensions
 
     hostname = socket.gethostname()
-    ip = get_ip_address()
 
     image = Image.new("RGBA", dimensions, bg_color)
     image_draw = ImageDraw.Draw(image)
@@ -63,8 +57,9 @@ def generate_startup_image(dimensions=(800,480)):
     title_font_size = width * 0.145
     image_draw.text((width/2, height/2), "inkypi", anchor="mm", fill=text_color, font=get_font("jost", title_font_size))
 
+    # shrink the hint for long hostnames so it stays on a single line
     text = f"To get started, visit http://{hostname}.local"
-    text_font_size = width * 0.032
+    text_font_size = fit_font_size(text, "jost", width * 0.9, height / 4, min_size=8, max_size=width * 0.032, wrap=False)
     image_draw.text((width/2, height*3/4), text, anchor="mm", fill=text_color, font=get_font("jost", text_font_size))
 
     return image
\ No newline at end of file
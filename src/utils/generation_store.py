@@ -0,0 +1,280 @@
+import os
+import json
+import zlib
+import time
+import hashlib
+import logging
+import threading
+from utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = "generations"
+INDEX_FILE = "index.json"
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+PREVIEW_SIZE = (240, 240)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_generation_store(device_config):
+    """Returns the shared GenerationStore under the device's cache directory."""
+    store_dir = os.path.join(device_config.cache_dir, STORE_DIR)
+    max_bytes = int(device_config.get_config("generation_store_max_mb") or 0) * 1024 * 1024 or DEFAULT_MAX_BYTES
+    with _stores_lock:
+        store = _stores.get(store_dir)
+        if store is None:
+            store = _stores[store_dir] = GenerationStore(store_dir, max_bytes)
+        store.max_bytes = max_bytes
+        return store
+
+def get_generation_key(plugin, settings, device_config):
+    """
+    Returns the store key and metadata of a plugin's generations for the settings and panel.
+
+    :param plugin: Plugin instance implementing get_generation_request.
+    """
+    orientation = device_config.get_config("orientation")
+    resolution = "x".join(map(str, device_config.get_resolution()))
+    plugin_id = plugin.config.get("id")
+    request = plugin.get_generation_request(settings)
+    key = GenerationStore.get_key(plugin_id=plugin_id, orientation=orientation, resolution=resolution, **request)
+    return key, {"plugin_id": plugin_id, "orientation": orientation, "resolution": resolution}
+
+def create_generation(plugin, settings, device_config, buffered=False, source="refresh"):
+    """
+    Makes a new generation of an AI plugin, renders it into a frame and stores it.
+
+    :param buffered: Store the generation as not shown yet, for the pre-generation queue.
+    :param source: What made the generation, stored in its metadata.
+    :return: Tuple of the generation name and the packed frame.
+    """
+    key, metadata = get_generation_key(plugin, settings, device_config)
+    image = plugin.generate_image(settings, device_config)
+    frame = plugin.render_frame(image, plugin.config.get("image_settings", []), metadata["orientation"])
+
+    name = None
+    try:
+        name = get_generation_store(device_config).add(key, frame, image, {**metadata, "buffered": buffered, "source": source})
+    except OSError as e:
+        logger.error(f"Failed to store generation: {e}")
+    return name, frame
+
+def generate_stored_frame(plugin, settings, device_config):
+    """
+    Returns the frame of an AI plugin to show, from a pre-generated or a new generation.
+
+    A frame buffered by the pre-generation queue is shown first. Otherwise a new
+    generation is made, and if that fails, e.g. when offline or rate limited, a stored
+    generation of the same request, or else any stored generation of the plugin for the
+    panel, is replayed instead of failing the refresh.
+
+    :param plugin: Plugin instance implementing get_generation_request.
+    :return: The packed frame.
+    """
+    store = get_generation_store(device_config)
+    key, metadata = get_generation_key(plugin, settings, device_config)
+
+    name, frame = store.pop_buffered(key)
+    record_cache_lookup("generation_buffer", frame is not None)
+    if frame is not None:
+        logger.info(f"Showing pre-generated generation {name}")
+        return frame
+
+    try:
+        _, frame = create_generation(plugin, settings, device_config)
+    except RuntimeError as e:
+        name, frame = store.replay(key, **metadata)
+        if frame is None:
+            raise
+        logger.warning(f"Generation failed ({e}), replaying stored generation {name}")
+    return frame
+
+class GenerationStore:
+    """
+    Content addressed store of AI generations as packed panel frames with small previews.
+
+    Generations are keyed by the hash of the request parameters (model, prompt, quality,
+    orientation, ...) and the generation time, so every generation of a request is kept
+    until the store exceeds max_bytes and the least recently used ones are evicted.
+    """
+
+    def __init__(self, store_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.entries = self._load_index()
+
+    @staticmethod
+    def get_key(**params):
+        """Hash of the request parameters a generation is stored under."""
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def add(self, key, frame, image=None, metadata=None):
+        """
+        Stores a generation.
+
+        :param frame: Packed panel frame.
+        :param image: Pillow Image the frame was rendered from, a preview is stored from it.
+        :param metadata: Dictionary stored with the generation, e.g. the plugin id and prompt.
+        :return: Name of the stored generation.
+        """
+        generated_at = time.time()
+        name = f"{key}-{int(generated_at * 1000)}"
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        frame_file = os.path.join(self.store_dir, name + ".bin")
+        self._write_file(frame_file, zlib.compress(bytes(frame), 6))
+        size = os.path.getsize(frame_file)
+
+        preview = None
+        if image is not None:
+            preview = name + ".png"
+            thumbnail = image.convert("RGB")
+            thumbnail.thumbnail(PREVIEW_SIZE)
+            thumbnail.save(os.path.join(self.store_dir, preview))
+            size += os.path.getsize(os.path.join(self.store_dir, preview))
+
+        with self.lock:
+            self.entries[name] = {
+                "key": key,
+                "generated_at": generated_at,
+                "last_used": generated_at,
+                "size": size,
+                "preview": preview,
+                "metadata": metadata or {}
+            }
+            self._evict()
+            self._save_index()
+        return name
+
+    def get_frame(self, name):
+        with open(os.path.join(self.store_dir, name + ".bin"), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def get_preview_path(self, name):
+        entry = self.entries.get(name)
+        if entry and entry["preview"]:
+            return os.path.join(self.store_dir, entry["preview"])
+        return None
+
+    def find(self, key=None, **metadata):
+        """
+        Returns the names of stored generations, least recently used first.
+
+        :param key: Only generations of this request key.
+        :param metadata: Only generations whose metadata has these values.
+        """
+        with self.lock:
+            matches = [
+                (entry["last_used"], name) for name, entry in self.entries.items()
+                if (key is None or entry["key"] == key)
+                and all(entry["metadata"].get(field) == value for field, value in metadata.items())
+            ]
+        return [name for _, name in sorted(matches)]
+
+    def replay(self, key, **metadata):
+        """
+        Returns a stored generation to show instead of a new one, rotating through them.
+
+        Generations of the same request are preferred, otherwise any generation matching
+        the metadata is used. The chosen generation becomes the most recently used one.
+
+        :return: Tuple of the generation name and its frame, or (None, None).
+        """
+        for name in self.find(key, **metadata) or self.find(**metadata):
+            try:
+                frame = self.get_frame(name)
+            except (OSError, zlib.error) as e:
+                logger.warning(f"Dropping unreadable generation {name}: {e}")
+                self.remove(name)
+                continue
+            self.touch(name)
+            return name, frame
+        return None, None
+
+    def count(self, key=None, since=None, **metadata):
+        """Number of stored generations matching the key and metadata, generated after since."""
+        with self.lock:
+            return sum(
+                1 for entry in self.entries.values()
+                if (key is None or entry["key"] == key)
+                and (since is None or entry["generated_at"] >= since)
+                and all(entry["metadata"].get(field) == value for field, value in metadata.items())
+            )
+
+    def pop_buffered(self, key):
+        """
+        Returns the oldest generation of the request that was buffered and not shown yet.
+
+        :return: Tuple of the generation name and its frame, or (None, None).
+        """
+        for name in self.find(key, buffered=True):
+            with self.lock:
+                self.entries[name]["metadata"]["buffered"] = False
+            try:
+                frame = self.get_frame(name)
+            except (OSError, zlib.error) as e:
+                logger.warning(f"Dropping unreadable generation {name}: {e}")
+                self.remove(name)
+                continue
+            self.touch(name)
+            return name, frame
+        return None, None
+
+    def touch(self, name):
+        with self.lock:
+            if name in self.entries:
+                self.entries[name]["last_used"] = time.time()
+                self._save_index()
+
+    def remove(self, name):
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            self._remove_files(name, entry)
+            self._save_index()
+
+    def get_size(self):
+        with self.lock:
+            return sum(entry["size"] for entry in self.entries.values())
+
+    def _evict(self):
+        total = self.get_size()
+        for _, name in sorted((entry["last_used"], name) for name, entry in self.entries.items()):
+            if total <= self.max_bytes:
+                break
+            entry = self.entries.pop(name)
+            total -= entry["size"]
+            self._remove_files(name, entry)
+            logger.info(f"Evicted generation {name}, store size: {total // 1024} KiB")
+
+    def _remove_files(self, name, entry):
+        files = [name + ".bin"]
+        if entry and entry["preview"]:
+            files.append(entry["preview"])
+        for file_name in files:
+            try:
+                os.remove(os.path.join(self.store_dir, file_name))
+            except FileNotFoundError:
+                pass
+
+    def _load_index(self):
+        index_file = os.path.join(self.store_dir, INDEX_FILE)
+        if not os.path.isfile(index_file):
+            return {}
+        try:
+            with open(index_file) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read generation store index {index_file}: {e}")
+            return {}
+
+    def _save_index(self):
+        self._write_file(os.path.join(self.store_dir, INDEX_FILE), json.dumps(self.entries, indent=2).encode())
+
+    @staticmethod
+    def _write_file(file_path, data):
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
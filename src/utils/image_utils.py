@@ -5,8 +5,8 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def get_image(image_url):
-    response = requests.get(image_url)
+def get_image(image_url, timeout=None):
+    response = requests.get(image_url, timeout=timeout)
     img = None
     if 200 <= response.status_code < 300 or response.status_code == 304:
         img = Image.open(BytesIO(response.content))
@@ -0,0 +1,138 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# upper bounds in seconds, from fast cache hits up to slow plugin fetches and panel refreshes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    """Returns the histogram registered under the name, registering it on first use."""
+    return _register(Histogram, name, documentation, labels, buckets)
+
+def counter(name, documentation, labels=()):
+    """Returns the counter registered under the name, registering it on first use."""
+    return _register(Counter, name, documentation, labels)
+
+def _register(metric_class, name, documentation, labels, *args):
+    with _metrics_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = metric_class(name, documentation, tuple(labels), *args)
+        return metric
+
+def render_metrics():
+    """Returns all registered metrics in the Prometheus text exposition format."""
+    with _metrics_lock:
+        metrics = sorted(_metrics.values(), key=lambda metric: metric.name)
+    return "".join(metric.render() for metric in metrics)
+
+def _label_values(names, labels):
+    return tuple("" if labels.get(name) is None else str(labels[name]) for name in names)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing count per label combination."""
+
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_values(self.labels, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(_label_values(self.labels, labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+class Histogram:
+    """
+    Distribution of observed values per label combination, in fixed buckets.
+
+    An observation is a bisect and two additions under a lock, the cumulative bucket
+    counts are only computed when the metrics are rendered.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # label values -> [per bucket counts (last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = _label_values(self.labels, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with block in seconds, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        with self.lock:
+            series = self.values.get(_label_values(self.labels, labels))
+            return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+CACHE_LOOKUPS = counter("inkypi_cache_lookups_total", "Cache lookups by cache and result (hit or miss).", labels=("cache", "result"))
+
+def record_cache_lookup(cache, hit):
+    """Counts a lookup of a named cache, the hit rate is the share of hits."""
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import fnmatch
+import hashlib
+import logging
+import threading
+import httpx
+import requests
+
+logger = logging.getLogger(__name__)
+
+RESPONSES_FILE = "responses.json"
+DEFAULT_FIXTURES_DIR = "network_fixtures"
+MODES = ["record", "replay"]
+# headers describing the transfer rather than the content, bodies are stored decoded
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie", "keep-alive"}
+
+_active = None
+_active_lock = threading.Lock()
+
+def install_network_replay(device_config):
+    """
+    Records or replays the network calls of the plugins as set in the device config.
+
+    network_mode is "record" or "replay", network_fixtures_dir the fixture directory
+    (default: network_fixtures in the cache directory) and replay_latency the factor
+    applied to the recorded response times when replaying (default: 0, no delay).
+
+    :return: The installed NetworkReplay, or None if the mode isn't set.
+    """
+    mode = device_config.get_config("network_mode")
+    if not mode:
+        return None
+    fixtures_dir = device_config.get_config("network_fixtures_dir") or os.path.join(device_config.cache_dir, DEFAULT_FIXTURES_DIR)
+    replay = NetworkReplay(fixtures_dir, mode, latency=float(device_config.get_config("replay_latency") or 0))
+    replay.install()
+    return replay
+
+class NetworkReplay:
+    """
+    Records the responses of HTTP calls into fixture files, or serves them from there.
+
+    Calls are intercepted below requests (the HTTPAdapter) and httpx (the HTTPTransport
+    the Open AI client uses), so plugins run unchanged. A fixture stores the status,
+    headers, response time and a body file, and is matched by method and exact url,
+    preferring fixtures recorded with the same request body. Hand written fixtures can set
+    a glob "url_pattern" instead of the url, they only match calls no recorded url matches.
+    A call without a fixture fails like a connection error when replaying.
+    """
+
+    def __init__(self, fixtures_dir, mode="replay", latency=0):
+        """
+        :param mode: "record" or "replay".
+        :param latency: Factor of the recorded response time to wait when replaying,
+            1 replays at the recorded speed, 0 without delay.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown network mode '{mode}', expected one of {', '.join(MODES)}.")
+        self.fixtures_dir = fixtures_dir
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.bodies = {}
+        self.responses = self._load_responses()
+        self.originals = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def install(self):
+        global _active
+        with _active_lock:
+            if _active is not None:
+                raise RuntimeError("Network record/replay is already installed.")
+            _active = self
+            self.originals = (requests.adapters.HTTPAdapter.send, httpx.HTTPTransport.handle_request)
+            requests.adapters.HTTPAdapter.send = _send_requests
+            httpx.HTTPTransport.handle_request = _handle_httpx_request
+        logger.warning(f"Network calls are {'recorded to' if self.mode == 'record' else 'replayed from'} {self.fixtures_dir}")
+
+    def uninstall(self):
+        global _active
+        with _active_lock:
+            if _active is self:
+                requests.adapters.HTTPAdapter.send, httpx.HTTPTransport.handle_request = self.originals
+                _active = None
+
+    def find(self, method, url, body=None):
+        """Returns the fixture of the request, or None."""
+        body_hash = NetworkReplay.get_body_hash(body)
+        with self.lock:
+            entries = [entry for entry in self.responses if entry["method"] == method.upper()]
+        # recorded urls contain ? and [] in query strings, only explicit patterns are globs
+        matches = [entry for entry in entries if entry.get("url") == url]
+        if not matches:
+            matches = [entry for entry in entries if "url_pattern" in entry and fnmatch.fnmatchcase(url, entry["url_pattern"])]
+        # the latest recording of the same request body wins, e.g. the same Open AI prompt
+        for entry in reversed(matches):
+            if entry.get("request_hash") == body_hash:
+                return entry
+        return matches[-1] if matches else None
+
+    def get_body(self, entry):
+        if not entry.get("body"):
+            return b""
+        with self.lock:
+            if entry["body"] not in self.bodies:
+                with open(os.path.join(self.fixtures_dir, entry["body"]), "rb") as f:
+                    self.bodies[entry["body"]] = f.read()
+            return self.bodies[entry["body"]]
+
+    def wait(self, entry):
+        if self.latency and entry.get("elapsed"):
+            time.sleep(entry["elapsed"] * self.latency)
+
+    def record(self, method, url, request_body, status, headers, content, elapsed):
+        """Stores a response as the fixture of the request, replacing an earlier recording of it."""
+        body = None
+        if content:
+            # bodies are stored by content hash, so repeated responses share a file
+            body = hashlib.sha256(content).hexdigest()[:32]
+            body_path = os.path.join(self.fixtures_dir, body)
+            if not os.path.isfile(body_path):
+                os.makedirs(self.fixtures_dir, exist_ok=True)
+                self._write_file(body_path, content)
+
+        entry = {
+            "method": method.upper(),
+            "url": url,
+            "request_hash": NetworkReplay.get_body_hash(request_body),
+            "status": status,
+            "headers": {name: value for name, value in headers.items() if name.lower() not in SKIPPED_HEADERS},
+            "elapsed": round(elapsed, 4),
+            "body": body
+        }
+        with self.lock:
+            self.responses = [
+                existing for existing in self.responses
+                if (existing["method"], existing.get("url"), existing.get("request_hash")) != (entry["method"], url, entry["request_hash"])
+            ]
+            self.responses.append(entry)
+            os.makedirs(self.fixtures_dir, exist_ok=True)
+            self._write_file(os.path.join(self.fixtures_dir, RESPONSES_FILE), json.dumps(self.responses, indent=4).encode())
+        logger.info(f"Recorded {method} {url}: {status}, {len(content)} bytes in {elapsed:.2f}s")
+
+    @staticmethod
+    def get_body_hash(body):
+        if not body:
+            return None
+        if isinstance(body, str):
+            body = body.encode()
+        return hashlib.sha256(body).hexdigest()[:16]
+
+    def _load_responses(self):
+        responses_file = os.path.join(self.fixtures_dir, RESPONSES_FILE)
+        if not os.path.isfile(responses_file):
+            if self.mode == "replay":
+                logger.warning(f"No recorded responses in {self.fixtures_dir}, all network calls will fail")
+            return []
+        with open(responses_file) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_file(file_path, data):
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+
+def _send_requests(adapter, request, **kwargs):
+    replay = _active
+    if replay.mode == "record":
+        start = time.perf_counter()
+        response = replay.originals[0](adapter, request, **kwargs)
+        # streamed responses are read completely, they are stored as a whole
+        content = response.content
+        replay.record(request.method, request.url, request.body, response.status_code, response.headers,
+                      content, time.perf_counter() - start)
+        return response
+
+    entry = replay.find(request.method, request.url, request.body)
+    if entry is None:
+        raise requests.exceptions.ConnectionError(f"No recorded response for {request.method} {request.url}", request=request)
+    replay.wait(entry)
+
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.headers = requests.structures.CaseInsensitiveDict(entry.get("headers", {}))
+    response._content = b"" if request.method == "HEAD" else replay.get_body(entry)
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    # there is no connection to read from, the body is complete
+    response._content_consumed = True
+    return response
+
+def _handle_httpx_request(transport, request):
+    replay = _active
+    url = str(request.url)
+    if replay.mode == "record":
+        start = time.perf_counter()
+        response = replay.originals[1](transport, request)
+        content = response.read()
+        replay.record(request.method, url, request.content, response.status_code, response.headers,
+                      content, time.perf_counter() - start)
+        return response
+
+    entry = replay.find(request.method, url, request.content)
+    if entry is None:
+        raise httpx.ConnectError(f"No recorded response for {request.method} {url}", request=request)
+    replay.wait(entry)
+    return httpx.Response(entry["status"], headers=entry.get("headers", {}), content=replay.get_body(entry), request=request)
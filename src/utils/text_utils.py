@@ -0,0 +1,98 @@
+import os
+import logging
+from functools import lru_cache
+from pathlib import Path
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+FONTS = {
+    "ds-gigi": "DS-DIGI.TTF",
+    "napoli": "Napoli.ttf",
+    "jost": "Jost.ttf",
+    "jost-semibold": "Jost-SemiBold.ttf"
+}
+
+@lru_cache(maxsize=64)
+def get_font(font_name, font_size=50):
+    if font_name in FONTS:
+        font_path = str(Path(os.getenv("SRC_DIR")) / "static" / "fonts" / FONTS[font_name])
+        return ImageFont.truetype(font_path, font_size)
+    else:
+        logger.warn(f"Requested font not found: font_name: {font_name}")
+    return None
+
+@lru_cache(maxsize=4096)
+def get_text_width(font, text):
+    """Advance width of text in pixels, memoized per font since fonts are cached by get_font."""
+    return font.getlength(text)
+
+def get_line_height(font, line_spacing=0):
+    ascent, descent = font.getmetrics()
+    return ascent + descent + line_spacing
+
+def wrap_text(text, font, max_width):
+    """
+    Greedily wrap text into lines no wider than max_width.
+
+    Each word is measured once and line widths are accumulated, so wrapping is linear
+    in the number of words. A completed line is measured once as a whole, kerning can
+    make it wider than the sum of its words, its last word then moves to the next line.
+    Explicit newlines always start a new line, a single word wider than max_width is
+    kept on its own line.
+
+    :return: List of lines.
+    """
+    space_width = get_text_width(font, " ")
+    lines = []
+    for paragraph in text.split("\n"):
+        current_line = []
+        line_width = 0
+        for word in paragraph.split():
+            word_width = get_text_width(font, word)
+            new_width = line_width + space_width + word_width if current_line else word_width
+            if current_line and new_width > max_width:
+                current_line = _add_line(lines, current_line, font, max_width)
+                line_width = sum(get_text_width(font, carried) + space_width for carried in current_line)
+                current_line.append(word)
+                line_width += word_width
+            else:
+                current_line.append(word)
+                line_width = new_width
+        carried = _add_line(lines, current_line, font, max_width)
+        if carried:
+            lines.append(" ".join(carried))
+    return lines
+
+def _add_line(lines, words, font, max_width):
+    """Adds the words as a line, returns the last word if kerning makes the whole line too wide."""
+    line = " ".join(words)
+    if len(words) > 1 and font.getlength(line) > max_width:
+        lines.append(" ".join(words[:-1]))
+        return words[-1:]
+    lines.append(line)
+    return []
+
+def fit_font_size(text, font_name, max_width, max_height, min_size=8, max_size=200, line_spacing=0, wrap=True):
+    """
+    Binary search for the largest font size at which the text fits into the box.
+
+    :param wrap: Word wrap the text at max_width, otherwise only explicit newlines break lines.
+    :return: The font size, never smaller than min_size.
+    """
+    def fits(size):
+        font = get_font(font_name, size)
+        lines = wrap_text(text, font, max_width) if wrap else text.split("\n")
+        if len(lines) * get_line_height(font, line_spacing) > max_height:
+            return False
+        # whole lines are measured without the cache, they rarely repeat
+        return all(font.getlength(line) <= max_width for line in lines)
+
+    low, high = int(min_size), int(max_size)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if fits(mid):
+            low = mid
+        else:
+            high = mid - 1
+    return low
@@ -0,0 +1,93 @@
+import os
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from PIL import Image, ImageOps
+from utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+FRAME_CACHE_DIR = "uploads"
+ORIENTATIONS = ["horizontal", "vertical"]
+
+def get_master_size(resolution):
+    """Shortest side of a master image, large enough to cover the panel in either orientation."""
+    return max(resolution)
+
+def ingest_image(file, save_dir, resolution):
+    """
+    Stores an uploaded image once as a panel sized master, keyed by its content hash.
+
+    The image is decoded at reduced scale where possible, rotated according to its
+    EXIF orientation and scaled down so its shorter side covers the panel in either
+    orientation. Uploading the same content again reuses the existing master.
+
+    :param file: Binary file-like object with the uploaded image.
+    :return: Tuple of the content hash and the path of the master image.
+    """
+    data = file.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+    master_path = os.path.join(save_dir, f"{content_hash}.png")
+    if os.path.isfile(master_path):
+        logger.info(f"Upload {content_hash[:12]} already stored")
+        return content_hash, master_path
+
+    image = Image.open(BytesIO(data))
+    master_size = get_master_size(resolution)
+    # jpegs are decoded at the smallest scale that still covers the master size
+    image.draft("RGB", (master_size, master_size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    scale = master_size / min(image.size)
+    if scale < 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+
+    os.makedirs(save_dir, exist_ok=True)
+    tmp_path = master_path + ".tmp"
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, master_path)
+    logger.info(f"Stored upload {content_hash[:12]} as {image.width}x{image.height} master")
+    return content_hash, master_path
+
+def is_master(file_path):
+    """Whether the file is a master stored by ingest_image, named by its content hash."""
+    name, extension = os.path.splitext(os.path.basename(file_path))
+    return extension == ".png" and len(name) == 64 and all(c in "0123456789abcdef" for c in name)
+
+def get_frame_path(cache_dir, master_path, resolution, orientation):
+    content_hash = os.path.splitext(os.path.basename(master_path))[0]
+    return os.path.join(cache_dir, FRAME_CACHE_DIR, f"{content_hash}-{resolution[0]}x{resolution[1]}-{orientation}.bin")
+
+def get_frame(master_path, device_config, render_frame, orientation, image_settings=[]):
+    """
+    Returns the packed frame of a master image, rendering and caching it on first use.
+    """
+    frame_path = get_frame_path(device_config.cache_dir, master_path, device_config.get_resolution(), orientation)
+    record_cache_lookup("upload_frame", os.path.isfile(frame_path))
+    if os.path.isfile(frame_path):
+        with open(frame_path, "rb") as f:
+            return f.read()
+
+    with Image.open(master_path) as image:
+        frame = render_frame(image, image_settings, orientation)
+
+    os.makedirs(os.path.dirname(frame_path), exist_ok=True)
+    tmp_path = f"{frame_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(frame)
+    os.replace(tmp_path, frame_path)
+    return frame
+
+def prerender_frames(master_path, device_config, render_frame, image_settings=[]):
+    """Renders the frames of a master image for both orientations on a background thread."""
+    def render():
+        for orientation in ORIENTATIONS:
+            try:
+                get_frame(master_path, device_config, render_frame, orientation, image_settings)
+            except Exception as e:
+                logger.error(f"Failed to render {orientation} frame of {master_path}: {e}")
+
+    threading.Thread(target=render, name="upload-frames", daemon=True).start()
@@ -28,17 +28,22 @@
 # THE SOFTWARE.
 #
 
+import time
 import logging
 from . import epdconfig
 
 import PIL
 from PIL import Image
 import io
+import numpy as np
 
 # Display resolution
 EPD_WIDTH       = 800
 EPD_HEIGHT      = 480
 
+# The 7 colors supported by the panel, indexed by their 4 bit panel value
+PALETTE = (0,0,0,  255,255,255,  0,255,0,   0,0,255,  255,0,0,  255,255,0, 255,128,0) + (0,0,0)*249
+
 logger = logging.getLogger(__name__)
 
 class EPD:
@@ -198,11 +203,12 @@ class EPD:
         self.send_data(0x00)
         return 0
 
-    def getbuffer(self, image):
+    # timings: optional dictionary receiving the duration of each step in seconds
+    def getbuffer(self, image, timings=None):
         logger.info("epd7in3f - getbuffer")
         # Create a pallette with the 7 colors supported by the panel
         pal_image = Image.new("P", (1,1))
-        pal_image.putpalette( (0,0,0,  255,255,255,  0,255,0,   0,0,255,  255,0,0,  255,255,0, 255,128,0) + (0,0,0)*249)
+        pal_image.putpalette(PALETTE)
 
         # Check if we need to rotate the image
         imwidth, imheight = image.size
@@ -217,30 +223,37 @@ class EPD:
 
         # Convert the soruce image to the 7 colors, dithering if needed
         logger.info("epd7in3f - convert")
+        start = time.perf_counter()
         image_7color = image_temp.convert("RGB").quantize(palette=pal_image)
+        quantized = time.perf_counter()
         logger.info("epd7in3f - toBuffer")
-        buf_7color = bytearray(image_7color.tobytes('raw'))
+        buf_7color = np.frombuffer(image_7color.tobytes('raw'), dtype=np.uint8)
 
         # PIL does not support 4 bit color, so pack the 4 bits of color
-        # into a single byte to transfer to the panel
-        buf = [0x00] * int(self.width * self.height / 2)
-        idx = 0
-        logger.info("epd7in3f - forLoop on buffer")
-        for i in range(0, len(buf_7color), 2):
-            buf[idx] = (buf_7color[i] << 4) + buf_7color[i+1]
-            idx += 1
-            
+        # of each pair of pixels into a single byte to transfer to the panel
+        logger.info("epd7in3f - pack buffer")
+        buf = ((buf_7color[0::2] << 4) | buf_7color[1::2]).tobytes()
+        if timings is not None:
+            timings["quantize"] = quantized - start
+            timings["pack"] = time.perf_counter() - quantized
+
         logger.info("epd7in3f - return buffer")
         return buf
 
-    def display(self, image):
+    # timings: optional dictionary receiving the duration of each step in seconds
+    def display(self, image, timings=None):
         logger.info("epd7in3f - display")
+        start = time.perf_counter()
         self.send_command(0x10)
         logger.info("epd7in3f - send image")
         self.send_data2(image)
+        sent = time.perf_counter()
 
         logger.info("epd7in3f - turnOnDisplay")
         self.TurnOnDisplay()
+        if timings is not None:
+            timings["spi_transfer"] = sent - start
+            timings["panel_refresh"] = time.perf_counter() - sent
         
     def Clear(self, color=0x11):
         logger.info("epd7in3f - clear")
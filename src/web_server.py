@@ -0,0 +1,90 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from utils.app_utils import resolve_path
+
+logger = logging.getLogger(__name__)
+
+# browsers open up to 6 connections per host, an idle one holds a worker until it
+# sends a request, so the pool is sized above that to leave workers for other clients
+DEFAULT_WORKERS = 8
+# seconds a connection may wait for its next request line, e.g. a browser's idle
+# preconnect or keep-alive connection, while holding a worker before it is closed
+KEEP_ALIVE_TIMEOUT = 2
+# seconds a read or write of a request in progress may stall, e.g. an upload over weak Wi-Fi
+REQUEST_TIMEOUT = 60
+# assets are requested with a version parameter, so browsers can keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT
+
+    def handle_one_request(self):
+        # only the wait for the next request is short, the request itself gets the full timeout
+        self.connection.settimeout(KEEP_ALIVE_TIMEOUT)
+        try:
+            self.rfile.peek(1)
+        except (TimeoutError, ConnectionError):
+            self.close_connection = True
+            return
+        self.connection.settimeout(REQUEST_TIMEOUT)
+        super().handle_one_request()
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server that handles connections on a bounded pool of worker threads."""
+
+    def __init__(self, host, port, app, workers=DEFAULT_WORKERS):
+        super().__init__(host, port, app, handler=KeepAliveRequestHandler)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+
+    def process_request(self, request, client_address):
+        # connections beyond the worker count wait in the executor queue
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+def configure_asset_caching(app):
+    """
+    Serves static files and plugin assets with long cache lifetimes.
+
+    URLs built with url_for carry the file's mtime as a version parameter, so an
+    updated file gets a new URL instead of a stale cached copy. Responses still
+    carry ETags for conditional requests.
+    """
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = ASSET_MAX_AGE
+    plugins_dir = resolve_path("plugins")
+
+    @app.url_defaults
+    def add_asset_version(endpoint, values):
+        if endpoint == "static":
+            file_path = os.path.join(app.static_folder, values.get("filename", ""))
+        elif endpoint == "plugin.image":
+            file_path = os.path.join(plugins_dir, values.get("plugin_id", ""), values.get("filename", ""))
+        else:
+            return
+
+        try:
+            values.setdefault("v", os.stat(file_path).st_mtime_ns)
+        except OSError:
+            pass
+
+def run_server(app, host="0.0.0.0", port=80, workers=DEFAULT_WORKERS):
+    server = PooledWSGIServer(host, port, app, workers=workers)
+    logger.info(f"Serving on http://{host}:{port} with {workers} workers")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()